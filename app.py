@@ -31,7 +31,9 @@ from controllers import (
     SettingsController,
 )
 from controllers.newsfeed.newsfeed import NewsfeedController
+from controllers.newsfeed.stream import NewsfeedHub
 from controllers.rank_card.mastery import MasteryController
+from controllers.rank_card.prerender import RankCardPrerenderer
 from middleware.umami import UmamiMiddleware
 
 if TYPE_CHECKING:
@@ -71,6 +73,7 @@ psql_db = os.getenv("PSQL_DB")
 
 dsn = f"postgresql://{psql_user}:{psql_pass}@{psql_host}:{psql_port}/{psql_db}"
 
+
 asyncpg = AsyncpgPlugin(config=AsyncpgConfig(pool_config=PoolConfig(dsn=dsn)))
 
 rabbitmq_user = os.getenv("RABBITMQ_DEFAULT_USER")
@@ -98,6 +101,34 @@ async def rabbitmq_connection(app: Litestar) -> AsyncGenerator[None, None]:
     yield
 
 
+@asynccontextmanager
+async def rank_card_prerenderer(app: Litestar) -> AsyncGenerator[None, None]:
+    """Re-render rank cards in the background when user data changes."""
+    prerenderer = RankCardPrerenderer(
+        lambda: asyncpg.config.provide_pool(app.state),
+        dsn=dsn,
+        concurrency=int(os.getenv("RANK_CARD_PRERENDER_CONCURRENCY", "2")),
+    )
+    prerenderer.start(getattr(app.state, "mq_channel_pool", None))
+    app.state.rank_card_prerenderer = prerenderer
+    try:
+        yield
+    finally:
+        await prerenderer.stop()
+
+
+@asynccontextmanager
+async def newsfeed_hub(app: Litestar) -> AsyncGenerator[None, None]:
+    """Listen for new newsfeed entries and fan them out to streaming clients."""
+    hub = NewsfeedHub(dsn)
+    hub.start()
+    app.state.newsfeed_hub = hub
+    try:
+        yield
+    finally:
+        await hub.stop()
+
+
 UMAMI_API_ENDPOINT = os.getenv("UMAMI_API_ENDPOINT")
 UMAMI_SITE_ID = os.getenv("UMAMI_SITE_ID")
 
@@ -133,7 +164,7 @@ app = Litestar(
         path="/",
     ),
     exception_handlers={HTTPException: plain_text_exception_handler},
-    lifespan=[rabbitmq_connection],
+    lifespan=[rabbitmq_connection, rank_card_prerenderer, newsfeed_hub],
     template_config=TemplateConfig(
         directory=Path("templates"),
         engine=JinjaTemplateEngine,
@@ -108,68 +108,49 @@ class CompletionsController(BaseController):
         page_number: Annotated[int, Parameter(ge=1)] = 1,
     ) -> list[PersonalRecordsResponse]:
         """Get personal records from a user."""
+        # Personal bests are kept per map in user_personal_bests. The page is read in index order and the
+        # per-difficulty totals are counted off the same index in the same query.
         query = """
-            WITH ranges ("range", "name") AS (
-                VALUES
-                    ('[0.0,2.35)'::numrange, 'Easy'),
-                    ('[2.35,4.12)'::numrange, 'Medium'),
-                    ('[4.12,5.88)'::numrange, 'Hard'),
-                    ('[5.88,7.65)'::numrange, 'Very Hard'),
-                    ('[7.65,9.41)'::numrange, 'Extreme'),
-                    ('[9.41,10.0]'::numrange, 'Hell')
-            ), c_data AS (
+            WITH totals AS (
                 SELECT
-                    r.map_code,
-                    coalesce(own.username, nickname) as nickname,
-                    global_name AS discord_tag,
-                    record AS time,
-                    avg(mr.difficulty) AS difficulty_value,
-                    CASE
-                        WHEN record < mm.gold THEN 'Gold'
-                        WHEN record < mm.silver AND record >= mm.gold THEN 'Silver'
-                        WHEN record < mm.bronze AND record >= mm.silver THEN 'Bronze'
-                    END AS medal,
-                    count(*) OVER() AS total_results
-                FROM records r
-                LEFT JOIN users u ON r.user_id = u.user_id
-                LEFT JOIN user_overwatch_usernames own ON own.user_id = r.user_id AND own.is_primary = true
-                LEFT JOIN map_medals mm ON r.map_code = mm.map_code
-                LEFT JOIN map_ratings mr ON r.map_code = mr.map_code
+                    coalesce(jsonb_object_agg(personal_best_difficulty_name(difficulty_rank), total), '{}')
+                        AS difficulty_totals,
+                    coalesce(sum(total), 0)::bigint AS total_results
+                FROM (
+                    SELECT difficulty_rank, count(*) AS total
+                    FROM user_personal_bests
+                    WHERE
+                        user_id = $2 AND
+                        difficulty_rank IS NOT NULL AND
+                        ($1::text IS NULL OR map_code = $1)
+                    GROUP BY difficulty_rank
+                ) t
+            ), page AS (
+                SELECT map_code, time, medal, difficulty_rank, is_world_record
+                FROM user_personal_bests
                 WHERE
-                    ($1::text IS NULL OR r.map_code = $1) AND
-                    r.user_id = $2
-                GROUP BY r.map_code, nickname, global_name, record , mm.gold, mm.silver, mm.bronze, own.username
-            ), world_records AS (
-                SELECT
-                    map_code,
-                    MIN(record) AS fastest_time
-                FROM records
-                GROUP BY map_code
+                    user_id = $2 AND
+                    difficulty_rank IS NOT NULL AND
+                    ($1::text IS NULL OR map_code = $1)
+                ORDER BY difficulty_rank, map_code
+                LIMIT $3::int
+                OFFSET $4::int
             )
             SELECT
-                cd.map_code,
-                cd.nickname,
-                cd.discord_tag,
-                cd.time,
-                cd.medal,
-                cd.total_results,
-                r2.name AS difficulty,
-                cd.time = wr.fastest_time AS is_world_record
-            FROM ranges r2
-            INNER JOIN c_data cd ON r2.range @> cd.difficulty_value
-            INNER JOIN world_records wr ON cd.map_code = wr.map_code
-            ORDER BY
-                CASE name
-                    WHEN 'Easy' THEN 1
-                    WHEN 'Medium' THEN 2
-                    WHEN 'Hard' THEN 3
-                    WHEN 'Very Hard' THEN 4
-                    WHEN 'Extreme' THEN 5
-                    WHEN 'Hell' THEN 6
-                END,
-                cd.map_code
-            LIMIT $3::int
-            OFFSET $4::int
+                p.map_code,
+                coalesce(own.username, u.nickname) AS nickname,
+                u.global_name AS discord_tag,
+                p.time,
+                p.medal,
+                t.total_results,
+                personal_best_difficulty_name(p.difficulty_rank) AS difficulty,
+                p.is_world_record,
+                t.difficulty_totals
+            FROM page p
+            CROSS JOIN totals t
+            LEFT JOIN users u ON u.user_id = $2
+            LEFT JOIN user_overwatch_usernames own ON own.user_id = $2 AND own.is_primary = true
+            ORDER BY p.difficulty_rank, p.map_code
         """
         offset = (page_number - 1) * page_size
         rows = await db_connection.fetch(query, map_code, user_id, page_size, offset)
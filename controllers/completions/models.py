@@ -28,6 +28,7 @@ class MapRecordProgressionResponse(msgspec.Struct):
 
 class PersonalRecordsResponse(BaseResponse):
     difficulty: str
+    difficulty_totals: dict[str, int]
 
 
 class TimePlayedPerRankResponse(msgspec.Struct):
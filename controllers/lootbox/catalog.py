@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import random
+from typing import TYPE_CHECKING
+
+import msgspec
+
+from utils.cache import LRUCache
+
+from .models import LootboxKeyTypeResponse, RewardTypeResponse
+
+if TYPE_CHECKING:
+    from asyncpg import Connection
+
+class LootboxCatalog:
+    """Snapshot of the reward and key catalogs with URLs built once and indexes for filtering."""
+
+    def __init__(self, rewards: list[RewardTypeResponse], key_types: list[str], active_key: str | None) -> None:
+        self.rewards = rewards
+        self.keys = [LootboxKeyTypeResponse(name=name) for name in key_types]
+        self.key_types = frozenset(key_types)
+        self.active_key = active_key
+        digest = hashlib.blake2b(msgspec.json.encode((rewards, key_types, active_key)), digest_size=16)
+        self.version = digest.hexdigest()
+
+        self._indexes: dict[str, dict[str, list[RewardTypeResponse]]] = {"type": {}, "key_type": {}, "rarity": {}}
+        # Pull pools per key_type, each mapping rarity to the rewards a pull can land on.
+        self.pools: dict[str, dict[str, list[RewardTypeResponse]]] = {}
+        self._rewards_by_key: dict[str, set[tuple[str, str]]] = {}
+        for reward in rewards:
+            for field, index in self._indexes.items():
+                index.setdefault(getattr(reward, field), []).append(reward)
+            self.pools.setdefault(reward.key_type, {}).setdefault(reward.rarity, []).append(reward)
+            self._rewards_by_key.setdefault(reward.key_type, set()).add((reward.type, reward.name))
+
+    def filter_rewards(
+        self, reward_type: str | None = None, key_type: str | None = None, rarity: str | None = None
+    ) -> list[RewardTypeResponse]:
+        """Get rewards matching every given filter, in catalog order."""
+        filters = {
+            field: value
+            for field, value in (("type", reward_type), ("key_type", key_type), ("rarity", rarity))
+            if value is not None
+        }
+        if not filters:
+            return self.rewards
+        candidates = min((self._indexes[field].get(value, []) for field, value in filters.items()), key=len)
+        return [
+            reward
+            for reward in candidates
+            if all(getattr(reward, field) == value for field, value in filters.items())
+        ]
+
+    def has_reward(self, key_type: str, reward_type: str, reward_name: str) -> bool:
+        """Check whether a reward exists for a key type."""
+        return (reward_type, reward_name) in self._rewards_by_key.get(key_type, ())
+
+
+# The catalog only changes on deploys or set_active_key, the TTL picks up rows edited directly in the database.
+_catalog: LRUCache[str, LootboxCatalog] = LRUCache(
+    maxsize=1, ttl=float(os.getenv("LOOTBOX_CATALOG_CACHE_TTL", "300"))
+)
+_catalog_lock = asyncio.Lock()
+
+
+async def _load_catalog(conn: Connection) -> LootboxCatalog:
+    query = "SELECT name, key_type, rarity, type FROM lootbox_reward_types ORDER BY key_type, name"
+    rewards = [RewardTypeResponse(**row) for row in await conn.fetch(query)]
+    key_types = [row["name"] for row in await conn.fetch("SELECT name FROM lootbox_key_types ORDER BY name")]
+    active_key = await conn.fetchval("SELECT key FROM lootbox_active_key LIMIT 1")
+    return LootboxCatalog(rewards, key_types, active_key)
+
+
+async def fetch_catalog(conn: Connection) -> LootboxCatalog:
+    """Get the cached catalog, loading it if it is missing or expired."""
+    catalog = _catalog.get("catalog")
+    if catalog is not None:
+        return catalog
+    async with _catalog_lock:
+        catalog = _catalog.get("catalog")
+        if catalog is None:
+            catalog = await _load_catalog(conn)
+            _catalog.set("catalog", catalog)
+    return catalog
+
+
+def pick_rewards(pools: dict[str, list[RewardTypeResponse]], rarities: list[str]) -> list[RewardTypeResponse]:
+    """Pick one reward per rolled rarity, skipping rarities with no rewards."""
+    return [random.choice(pools[rarity]) for rarity in map(str.lower, rarities) if pools.get(rarity)]
+
+
+async def fetch_owned_rewards(
+    conn: Connection, user_id: int, key_type: str, rewards: list[RewardTypeResponse]
+) -> set[tuple[str, str]]:
+    """Get the (type, name) pairs from rewards the user already owns."""
+    if not rewards:
+        return set()
+    query = """
+        SELECT reward_type, reward_name
+        FROM lootbox_user_rewards
+        WHERE
+            user_id = $1::bigint AND
+            key_type = $2::text AND
+            reward_name = ANY($3::text[])
+    """
+    rows = await conn.fetch(query, user_id, key_type, list({reward.name for reward in rewards}))
+    return {(row["reward_type"], row["reward_name"]) for row in rows}
+
+
+def invalidate_reward_catalog() -> None:
+    """Drop the cached catalog so the next read reloads it."""
+    _catalog.clear()
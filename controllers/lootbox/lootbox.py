@@ -1,11 +1,60 @@
+import base64
+import binascii
+from typing import Annotated, TypeVar
+
+import msgspec
 from asyncpg import Connection
-from litestar import Request, get, post, put
+from litestar import Request, Response, get, post, put
 from litestar.exceptions import HTTPException
+from litestar.params import Parameter
+from litestar.status_codes import HTTP_304_NOT_MODIFIED
 
-from utils.pull import gacha
+from utils.pull import COIN_CONVERT, gacha
 
 from ..root import BaseController
-from .models import LootboxKeyTypeResponse, RewardTypeResponse, UserLootboxKeyAmountsResponse, UserRewardsResponse
+from .catalog import (
+    LootboxCatalog,
+    fetch_catalog,
+    fetch_owned_rewards,
+    invalidate_reward_catalog,
+    pick_rewards,
+)
+from .models import (
+    BulkGrantResultResponse,
+    BulkKeyGrantBody,
+    BulkRewardGrantBody,
+    LootboxKeyTypeResponse,
+    LootboxOpenBody,
+    RewardTypeResponse,
+    UserLootboxKeyAmountsResponse,
+    UserRewardsPageResponse,
+    UserRewardsResponse,
+)
+
+T = TypeVar("T")
+
+# Largest balance the int users.coins column holds. Bulk grants past it are rejected, and the upsert still caps
+# at it in case the balance grew since it was read.
+MAX_COINS = 2**31 - 1
+
+
+def _catalog_response(request: Request, catalog: LootboxCatalog, content: T) -> Response[T]:
+    etag = f'"{catalog.version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(content=None, status_code=HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=content, headers=headers)
+
+
+def _encode_cursor(reward_type: str, name: str, key_type: str) -> str:
+    return base64.urlsafe_b64encode(msgspec.json.encode((reward_type, name, key_type))).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[str, str, str]:
+    try:
+        return msgspec.json.decode(base64.urlsafe_b64decode(cursor), type=tuple[str, str, str])
+    except (binascii.Error, ValueError, msgspec.DecodeError):
+        raise HTTPException(detail="Invalid cursor.", status_code=400) from None
 
 
 class LootboxController(BaseController):
@@ -15,40 +64,33 @@ class LootboxController(BaseController):
     @get(path="/rewards")
     async def view_all_rewards(
         self,
+        request: Request,
         db_connection: Connection,
         reward_type: str | None = None,
         key_type: str | None = None,
         rarity: str | None = None,
-    ) -> list[RewardTypeResponse]:
+    ) -> Response[list[RewardTypeResponse]]:
         """View all possible rewards optionally filtered by reward_type."""
-        query = """
-            SELECT *
-            FROM lootbox_reward_types
-            WHERE
-                ($1::text IS NULL OR type = $1::text) AND
-                ($2::text IS NULL OR key_type = $2::text) AND
-                ($3::text IS NULL OR rarity = $3::text)
-            ORDER BY key_type, name
-        """
-        rows = await db_connection.fetch(query, reward_type, key_type, rarity)
-        return [RewardTypeResponse(**row) for row in rows]
+        catalog = await fetch_catalog(db_connection)
+        return _catalog_response(request, catalog, catalog.filter_rewards(reward_type, key_type, rarity))
 
     @get(path="/keys")
     async def view_all_keys(
         self,
+        request: Request,
         db_connection: Connection,
         key_type: str | None = None,
-    ) -> list[LootboxKeyTypeResponse]:
+    ) -> Response[list[LootboxKeyTypeResponse]]:
         """View all possible keys optionally filtered by key_type."""
-        query = """
-            SELECT *
-            FROM lootbox_key_types
-            WHERE
-                ($1::text IS NULL OR name = $1::text)
-            ORDER BY name
-        """
-        rows = await db_connection.fetch(query, key_type)
-        return [LootboxKeyTypeResponse(**row) for row in rows]
+        catalog = await fetch_catalog(db_connection)
+        keys = catalog.keys if key_type is None else [key for key in catalog.keys if key.name == key_type]
+        return _catalog_response(request, catalog, keys)
+
+    @get(path="/keys/active")
+    async def view_active_key(self, request: Request, db_connection: Connection) -> Response[str | None]:
+        """View the currently active key."""
+        catalog = await fetch_catalog(db_connection)
+        return _catalog_response(request, catalog, catalog.active_key)
 
     @get(path="/user/{user_id:int}/rewards")
     async def view_user_rewards(
@@ -93,6 +135,101 @@ class LootboxController(BaseController):
         rows = await db_connection.fetch(query, user_id, reward_type, key_type, rarity)
         return [UserRewardsResponse(**row) for row in rows]
 
+    @get(path="/user/{user_id:int}/rewards/page")
+    async def view_user_rewards_page(
+        self,
+        request: Request,
+        db_connection: Connection,
+        user_id: int,
+        *,
+        reward_type: str | None = None,
+        key_type: str | None = None,
+        rarity: str | None = None,
+        cursor: str | None = None,
+        page_size: Annotated[int, Parameter(ge=1, le=100)] = 50,
+    ) -> Response[UserRewardsPageResponse]:
+        """View a page of a user's rewards ordered by type, name and key type.
+
+        Pass next_cursor from the previous page as cursor to get the next one.
+        """
+        version = await db_connection.fetchval(
+            "SELECT version FROM lootbox_user_inventory_versions WHERE user_id = $1", user_id
+        )
+        etag = f'"{user_id}.{version or 0}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(content=None, status_code=HTTP_304_NOT_MODIFIED, headers=headers)
+
+        after = _decode_cursor(cursor) if cursor else (None, None, None)
+        # Mastery has no key type, so it sorts with an empty one and is excluded when filtering by key type.
+        query = """
+            (
+                SELECT DISTINCT ON (ur.reward_type, ur.reward_name, ur.key_type)
+                    ur.user_id,
+                    ur.earned_at,
+                    ur.reward_name AS name,
+                    ur.reward_type AS type,
+                    NULL AS medal,
+                    rt.rarity,
+                    ur.key_type
+                FROM lootbox_user_rewards ur
+                JOIN lootbox_reward_types rt ON ur.reward_name = rt.name
+                    AND ur.reward_type = rt.type
+                    AND ur.key_type = rt.key_type
+                WHERE
+                    ur.user_id = $1::bigint AND
+                    ($2::text IS NULL OR ur.reward_type = $2::text) AND
+                    ($3::text IS NULL OR ur.key_type = $3::text) AND
+                    ($4::text IS NULL OR rt.rarity = $4::text) AND
+                    ($5::text IS NULL OR (ur.reward_type, ur.reward_name, ur.key_type) > ($5, $6, $7))
+                ORDER BY ur.reward_type, ur.reward_name, ur.key_type, ur.earned_at
+                LIMIT $8
+            )
+
+            UNION ALL
+
+            (
+                SELECT
+                    user_id,
+                    NULL AS earned_at,
+                    map_name AS name,
+                    'mastery' AS type,
+                    medal,
+                    'common' AS rarity,
+                    '' AS key_type
+                FROM map_mastery
+                WHERE
+                    user_id = $1::bigint AND
+                    medal != 'Placeholder' AND
+                    ($2::text IS NULL OR $2::text = 'mastery') AND
+                    $3::text IS NULL AND
+                    ($4::text IS NULL OR $4::text = 'common') AND
+                    ($5::text IS NULL OR ('mastery', map_name, '') > ($5, $6, $7))
+                ORDER BY map_name
+                LIMIT $8
+            )
+
+            ORDER BY type, name, key_type
+            LIMIT $8
+        """
+        rows = await db_connection.fetch(query, user_id, reward_type, key_type, rarity, *after, page_size + 1)
+        rewards = [
+            UserRewardsResponse(
+                user_id=row["user_id"],
+                earned_at=row["earned_at"],
+                name=row["name"],
+                type=row["type"],
+                rarity=row["rarity"],
+                medal=row["medal"],
+            )
+            for row in rows[:page_size]
+        ]
+        next_cursor = None
+        if len(rows) > page_size:
+            last = rows[page_size - 1]
+            next_cursor = _encode_cursor(last["type"], last["name"], last["key_type"])
+        return Response(content=UserRewardsPageResponse(rewards, next_cursor), headers=headers)
+
     @get(path="/users/{user_id:int}/keys")
     async def view_user_keys(
         self,
@@ -102,12 +239,12 @@ class LootboxController(BaseController):
     ) -> list[UserLootboxKeyAmountsResponse]:
         """View keys owned by a particular user."""
         query = """
-            SELECT count(*) as amount, key_type
-            FROM lootbox_user_keys
+            SELECT balance as amount, key_type
+            FROM lootbox_user_key_balances
             WHERE
                 ($1::bigint = user_id) AND
-                ($2::text IS NULL OR key_type = $2::text)
-            GROUP BY key_type
+                ($2::text IS NULL OR key_type = $2::text) AND
+                balance > 0
         """
 
         rows = await db_connection.fetch(query, user_id, key_type)
@@ -115,20 +252,35 @@ class LootboxController(BaseController):
 
     @staticmethod
     async def _get_user_key_count(conn: Connection, user_id: int, key_type: str) -> int:
-        query = "SELECT count(*) as keys FROM lootbox_user_keys WHERE key_type = $1 AND user_id = $2"
-        return await conn.fetchval(query, key_type, user_id)
+        query = "SELECT balance FROM lootbox_user_key_balances WHERE key_type = $1 AND user_id = $2"
+        return await conn.fetchval(query, key_type, user_id) or 0
 
     @staticmethod
-    async def _use_user_key(conn: Connection, user_id: int, key_type: str) -> None:
+    async def _use_user_keys(conn: Connection, user_id: int, key_type: str, amount: int = 1) -> bool:
+        """Spend keys if the user has enough. Must run inside a transaction.
+
+        The balance row stays locked until commit and the ledger delete trigger decrements it.
+        """
+        query = """
+            SELECT balance
+            FROM lootbox_user_key_balances
+            WHERE user_id = $1::bigint AND key_type = $2::text
+            FOR UPDATE;
+        """
+        if (await conn.fetchval(query, user_id, key_type) or 0) < amount:
+            return False
         query = """
             DELETE FROM lootbox_user_keys
-            WHERE earned_at = (
-                SELECT MIN(earned_at)
+            WHERE ctid = ANY(ARRAY(
+                SELECT ctid
                 FROM lootbox_user_keys
                 WHERE user_id = $1::bigint AND key_type = $2::text
-            ) AND user_id = $1::bigint AND key_type = $2::text;
+                ORDER BY earned_at
+                LIMIT $3
+            ));
         """
-        await conn.execute(query, user_id, key_type)
+        await conn.execute(query, user_id, key_type, amount)
+        return True
 
     @get(path="/users/{user_id:int}/keys/{key_type:str}")
     async def get_random_items(
@@ -144,53 +296,72 @@ class LootboxController(BaseController):
         if key_count <= 0 and not request.headers.get("x-test-mode"):
             raise HTTPException(detail="User does not have enough keys for this action.", status_code=400)
 
-        rarities = gacha(amount)
+        catalog = await fetch_catalog(db_connection)
+        rewards = pick_rewards(catalog.pools.get(key_type, {}), gacha(amount))
+        owned = await fetch_owned_rewards(db_connection, user_id, key_type, rewards)
         items = []
-        query = """
-            WITH selected_rewards AS (
-                SELECT *
-                FROM lootbox_reward_types
-                WHERE
-                    rarity = $1::text AND
-                    key_type = $2::text
-                ORDER BY random()
-                LIMIT 1
-            )
-            SELECT
-                sr.*,
-                EXISTS(
-                    SELECT 1
-                    FROM lootbox_user_rewards ur
-                    WHERE ur.user_id = $3::bigint AND
-                        ur.reward_name = sr.name AND
-                        ur.reward_type = sr.type AND
-                        ur.key_type = $2::text
-                ) AS duplicate,
-                CASE
-                    WHEN EXISTS(
-                        SELECT 1
-                        FROM lootbox_user_rewards ur
-                        WHERE ur.user_id = $3::bigint AND
-                            ur.reward_name = sr.name AND
-                            ur.reward_type = sr.type AND
-                            ur.key_type = $2::text
-                    )
-                    THEN CASE
-                        WHEN sr.rarity = 'common' THEN 100
-                        WHEN sr.rarity = 'rare' THEN 250
-                        WHEN sr.rarity = 'epic' THEN 500
-                        WHEN sr.rarity = 'legendary' THEN 1000
-                        ELSE 0
-                    END
-                ELSE 0
-                END AS coin_amount
-            FROM selected_rewards sr;
-        """
-        for rarity in rarities:
-            reward = await db_connection.fetchrow(query, rarity.lower(), key_type, user_id)
-            items.append(reward)
+        for reward in rewards:
+            duplicate = (reward.type, reward.name) in owned
+            coin_amount = COIN_CONVERT.get(reward.rarity, 0) if duplicate else 0
+            items.append(msgspec.structs.replace(reward, duplicate=duplicate, coin_amount=coin_amount))
+        return items
+
+    @post(path="/users/{user_id:int}/open")
+    async def open_lootboxes(
+        self,
+        request: Request,
+        db_connection: Connection,
+        user_id: int,
+        data: LootboxOpenBody,
+    ) -> list[RewardTypeResponse]:
+        """Open several lootboxes, granting one reward per box and converting duplicates to coins."""
+        test_mode = bool(request.headers.get("x-test-mode"))
+        catalog = await fetch_catalog(db_connection)
+        pools = catalog.pools.get(data.key_type)
+        if not pools:
+            raise HTTPException(detail="Key type does not exist.", status_code=400)
+        # Roll before spending keys, a rarity with no rewards would otherwise cost a key for nothing.
+        rewards = pick_rewards(pools, gacha(data.amount))
+        if len(rewards) != data.amount:
+            raise HTTPException(detail="Rolled a rarity with no rewards for this key type.", status_code=400)
+
+        async with db_connection.transaction():
+            if not test_mode and not await self._use_user_keys(db_connection, user_id, data.key_type, data.amount):
+                raise HTTPException(detail="User does not have enough keys for this action.", status_code=400)
 
-        return [RewardTypeResponse(**row) for row in items]
+            owned = await fetch_owned_rewards(db_connection, user_id, data.key_type, rewards)
+            items = []
+            new_types, new_names = [], []
+            coins = 0
+            for reward in rewards:
+                key = (reward.type, reward.name)
+                duplicate = key in owned
+                coin_amount = COIN_CONVERT.get(reward.rarity, 0) if duplicate else 0
+                if duplicate:
+                    coins += coin_amount
+                else:
+                    # Later pulls of the same reward in this batch are duplicates too.
+                    owned.add(key)
+                    new_types.append(reward.type)
+                    new_names.append(reward.name)
+                items.append(msgspec.structs.replace(reward, duplicate=duplicate, coin_amount=coin_amount))
+
+            if test_mode:
+                return items
+            if new_names:
+                query = """
+                    INSERT INTO lootbox_user_rewards (user_id, reward_type, key_type, reward_name)
+                    SELECT $1, t.reward_type, $2, t.reward_name
+                    FROM unnest($3::text[], $4::text[]) AS t(reward_type, reward_name)
+                """
+                await db_connection.execute(query, user_id, data.key_type, new_types, new_names)
+            if coins:
+                query = """
+                    INSERT INTO users (user_id, coins) VALUES ($1, $2)
+                    ON CONFLICT (user_id) DO UPDATE SET coins = users.coins + excluded.coins
+                """
+                await db_connection.execute(query, user_id, coins)
+        return items
 
     @post(path="/users/{user_id:int}/{key_type:str}/{reward_type:str}/{reward_name:str}")
     async def grant_reward_to_user(
@@ -222,17 +393,13 @@ class LootboxController(BaseController):
         is_duplicate = await db_connection.fetchval(query, user_id, reward_type, key_type, reward_name)
         if is_duplicate:
             reward_type = "coins"
-            coin_convert = {
-                "common": 100,
-                "rare": 250,
-                "epic": 500,
-                "legendary": 1000,
-            }
-            reward_name = str(coin_convert[is_duplicate])
+            reward_name = str(COIN_CONVERT[is_duplicate])
 
         async with db_connection.transaction():
-            if not request.headers.get("x-test-mode"):
-                await self._use_user_key(db_connection, user_id, key_type)
+            if not request.headers.get("x-test-mode") and not await self._use_user_keys(
+                db_connection, user_id, key_type
+            ):
+                raise HTTPException(detail="User does not have enough keys for this action.", status_code=400)
             if reward_type != "coins":
                 query = """
                     INSERT INTO lootbox_user_rewards (user_id, reward_type, key_type, reward_name)
@@ -254,6 +421,129 @@ class LootboxController(BaseController):
         """
         await db_connection.execute(query, user_id, key_type)
 
+    @staticmethod
+    async def _fetch_user_coins(conn: Connection, user_ids: list[int]) -> dict[int, int]:
+        query = "SELECT user_id, coalesce(coins, 0) AS coins FROM users WHERE user_id = ANY($1::bigint[])"
+        return {row["user_id"]: row["coins"] for row in await conn.fetch(query, list(set(user_ids)))}
+
+    @post(path="/users/keys/bulk")
+    async def bulk_grant_keys(
+        self,
+        request: Request,
+        db_connection: Connection,
+        data: BulkKeyGrantBody,
+    ) -> list[BulkGrantResultResponse]:
+        """Grant keys to many users at once, reporting whether each grant was applied."""
+        catalog = await fetch_catalog(db_connection)
+        users = await self._fetch_user_coins(db_connection, [grant.user_id for grant in data.grants])
+        results = []
+        granted = []
+        for index, grant in enumerate(data.grants):
+            if grant.user_id not in users:
+                detail = "User does not exist."
+            elif grant.key_type not in catalog.key_types:
+                detail = "Key type does not exist."
+            else:
+                detail = None
+                granted.append(grant)
+            results.append(BulkGrantResultResponse(index, grant.user_id, detail is None, detail))
+
+        if granted and not request.headers.get("x-test-mode"):
+            query = """
+                INSERT INTO lootbox_user_keys (user_id, key_type)
+                SELECT g.user_id, g.key_type
+                FROM unnest($1::bigint[], $2::text[], $3::int[]) AS g(user_id, key_type, count),
+                    generate_series(1, g.count)
+            """
+            async with db_connection.transaction():
+                await db_connection.execute(
+                    query,
+                    [grant.user_id for grant in granted],
+                    [grant.key_type for grant in granted],
+                    [grant.count for grant in granted],
+                )
+        return results
+
+    @post(path="/users/rewards/bulk")
+    async def bulk_grant_rewards(
+        self,
+        request: Request,
+        db_connection: Connection,
+        data: BulkRewardGrantBody,
+    ) -> list[BulkGrantResultResponse]:
+        """Grant rewards or coins to many users at once without using keys, reporting each grant's result."""
+        users = await self._fetch_user_coins(db_connection, [grant.user_id for grant in data.grants])
+        catalog = await fetch_catalog(db_connection)
+
+        query = """
+            SELECT ur.user_id, ur.key_type, ur.reward_type, ur.reward_name
+            FROM lootbox_user_rewards ur
+            JOIN unnest($1::bigint[], $2::text[], $3::text[], $4::text[])
+                AS g(user_id, key_type, reward_type, reward_name)
+                ON ur.user_id = g.user_id
+                AND ur.key_type = g.key_type
+                AND ur.reward_type = g.reward_type
+                AND ur.reward_name = g.reward_name
+        """
+        rows = await db_connection.fetch(
+            query,
+            [grant.user_id for grant in data.grants],
+            [grant.key_type for grant in data.grants],
+            [grant.reward_type for grant in data.grants],
+            [grant.reward_name for grant in data.grants],
+        )
+        owned = {tuple(row.values()) for row in rows}
+
+        results = []
+        rewards = []
+        coins: dict[int, int] = {}
+        for index, grant in enumerate(data.grants):
+            key = (grant.user_id, grant.key_type, grant.reward_type, grant.reward_name)
+            if grant.user_id not in users:
+                detail = "User does not exist."
+            elif grant.reward_type == "coins":
+                if not (grant.reward_name.isascii() and grant.reward_name.isdigit()):
+                    detail = "Coin amount must be a whole number."
+                elif users[grant.user_id] + coins.get(grant.user_id, 0) + int(grant.reward_name) > MAX_COINS:
+                    detail = f"Coin balance would exceed {MAX_COINS}."
+                else:
+                    detail = None
+                    coins[grant.user_id] = coins.get(grant.user_id, 0) + int(grant.reward_name)
+            elif not catalog.has_reward(grant.key_type, grant.reward_type, grant.reward_name):
+                detail = "Reward does not exist."
+            elif key in owned:
+                detail = "User already has this reward."
+            else:
+                detail = None
+                owned.add(key)
+                rewards.append(grant)
+            results.append(BulkGrantResultResponse(index, grant.user_id, detail is None, detail))
+
+        if request.headers.get("x-test-mode"):
+            return results
+        async with db_connection.transaction():
+            if rewards:
+                query = """
+                    INSERT INTO lootbox_user_rewards (user_id, reward_type, key_type, reward_name)
+                    SELECT * FROM unnest($1::bigint[], $2::text[], $3::text[], $4::text[])
+                """
+                await db_connection.execute(
+                    query,
+                    [grant.user_id for grant in rewards],
+                    [grant.reward_type for grant in rewards],
+                    [grant.key_type for grant in rewards],
+                    [grant.reward_name for grant in rewards],
+                )
+            if coins:
+                query = """
+                    INSERT INTO users (user_id, coins)
+                    SELECT * FROM unnest($1::bigint[], $2::int[])
+                    ON CONFLICT (user_id) DO UPDATE
+                    SET coins = least(users.coins::bigint + excluded.coins, $3::bigint)
+                """
+                await db_connection.execute(query, list(coins), list(coins.values()), MAX_COINS)
+        return results
+
     @post(path="/users/debug/{user_id:int}/{key_type:str}/{reward_type:str}/{reward_name:str}")
     async def debug_grant_reward_no_key(
         self,
@@ -284,6 +574,7 @@ class LootboxController(BaseController):
             return
         query = "UPDATE lootbox_active_key SET key = $1;"
         await db_connection.execute(query, key_type)
+        invalidate_reward_catalog()
 
     @post(path="/users/{user_id:int}/coins")
     async def get_user_coins_amount(
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import datetime  # noqa: TC003
+from typing import Annotated
 
 import msgspec
 
@@ -19,7 +20,8 @@ class RewardTypeResponse(msgspec.Struct):
 
     def __post_init__(self) -> None:
         """Post init."""
-        self.url = _reward_url(self.type, self.name)
+        if self.url is None:
+            self.url = _reward_url(self.type, self.name)
 
 
 class LootboxKeyTypeResponse(msgspec.Struct):
@@ -28,7 +30,7 @@ class LootboxKeyTypeResponse(msgspec.Struct):
 
 class UserRewardsResponse(msgspec.Struct):
     user_id: int
-    earned_at: datetime.datetime
+    earned_at: datetime.datetime | None
     name: str
     type: str
     rarity: str
@@ -46,6 +48,11 @@ class UserRewardsResponse(msgspec.Struct):
             self.url = _reward_url(self.type, self.name)
 
 
+class UserRewardsPageResponse(msgspec.Struct):
+    rewards: list[UserRewardsResponse]
+    next_cursor: str | None = None
+
+
 def _reward_url(type_: str, name: str) -> str:
     sanitized_name = sanitize_string(name)
     if type_ == "spray":
@@ -66,3 +73,36 @@ def _reward_url(type_: str, name: str) -> str:
 class UserLootboxKeyAmountsResponse(msgspec.Struct):
     key_type: str
     amount: int
+
+
+class LootboxOpenBody(msgspec.Struct):
+    key_type: str
+    amount: Annotated[int, msgspec.Meta(ge=1, le=50)] = 1
+
+
+class KeyGrant(msgspec.Struct):
+    user_id: int
+    key_type: str
+    count: Annotated[int, msgspec.Meta(ge=1, le=100)] = 1
+
+
+class BulkKeyGrantBody(msgspec.Struct):
+    grants: Annotated[list[KeyGrant], msgspec.Meta(min_length=1, max_length=1000)]
+
+
+class RewardGrant(msgspec.Struct):
+    user_id: int
+    key_type: str
+    reward_type: str
+    reward_name: str
+
+
+class BulkRewardGrantBody(msgspec.Struct):
+    grants: Annotated[list[RewardGrant], msgspec.Meta(min_length=1, max_length=1000)]
+
+
+class BulkGrantResultResponse(msgspec.Struct):
+    index: int
+    user_id: int
+    granted: bool
+    detail: str | None = None
@@ -8,6 +8,7 @@ from litestar.exceptions import HTTPException
 from litestar.params import Parameter
 
 from utils import rabbit
+from utils.map_totals import invalidate_map_totals
 from utils.utilities import (
     DIFFICULTIES_T,
     MAP_NAME_T,
@@ -459,6 +460,7 @@ class MapsController(BaseController):
         if request.headers.get("x-test-mode"):
             return data
         await data.insert_all(db_connection)
+        invalidate_map_totals()
         await rabbit.publish(state, "new_map", data)
 
     @staticmethod
@@ -514,6 +516,7 @@ class MapsController(BaseController):
                     await self._remove_map_medal_entries(db_connection, map_.map_code)
         except Exception:
             raise HTTPException(detail="Unable to convert maps to legacy.", status_code=400)
+        invalidate_map_totals()
         await rabbit.publish(
             state,
             "bulk_legacy",
@@ -540,6 +543,7 @@ class MapsController(BaseController):
         except Exception:
             return
 
+        invalidate_map_totals()
         await rabbit.publish(
             state,
             "bulk_archive",
@@ -565,6 +569,7 @@ class MapsController(BaseController):
         except Exception:
             return
 
+        invalidate_map_totals()
         await rabbit.publish(
             state,
             "bulk_unarchive",
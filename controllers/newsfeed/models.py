@@ -1,7 +1,10 @@
 import datetime
+from typing import Annotated
 
 import msgspec
 
+from utils.utilities import convert_num_to_difficulty
+
 
 class NewsfeedRecordResponse(msgspec.Struct, omit_defaults=True):
     record: float | None = None
@@ -28,13 +31,18 @@ class NewsfeedMapResponse(msgspec.Struct, omit_defaults=True):
     restrictions: list[str] | None = None
     checkpoints: int | None = None
     creators: list[str] | None = None
-    difficulty: str | None = None
+    difficulty: str | float | None = None
     quality: float | None = None
     creator_ids: list[int] | None = None
     gold: float | None = None
     silver: float | None = None
     bronze: float | None = None
 
+    def __post_init__(self) -> None:
+        """Convert a numerical difficulty to its name."""
+        if isinstance(self.difficulty, float):
+            self.difficulty = convert_num_to_difficulty(self.difficulty)
+
 
 class NewsfeedMessageResponse(msgspec.Struct, omit_defaults=True):
     content: str
@@ -48,12 +56,45 @@ class NewsfeedDataResponse(msgspec.Struct, omit_defaults=True):
     bulk: list[NewsfeedMapResponse] | None = None
 
 
-class NewsfeedResponse(msgspec.Struct):
+class NewsfeedEventResponse(msgspec.Struct):
     type: str
     timestamp: datetime.datetime
     data: NewsfeedDataResponse
+
+
+class NewsfeedResponse(NewsfeedEventResponse):
     total_results: int
 
 
+class NewsfeedStreamEvent(NewsfeedEventResponse):
+    content_hash: str
+
+    @property
+    def event_id(self) -> str:
+        """SSE id, unique even for entries that share a timestamp."""
+        return f"{self.timestamp.isoformat()}/{self.content_hash}"
+
+
+# Builds NewsfeedDataResponse JSON from a newsfeed row.
+# Bulk events store a list of {"map": ...} objects, reshaped into the {"bulk": [...]} data shape.
+NEWSFEED_DATA_SQL = """
+    CASE
+        WHEN jsonb_typeof(data::jsonb) = 'array' THEN jsonb_build_object(
+            'bulk', (SELECT jsonb_agg(item -> 'map') FROM jsonb_array_elements(data::jsonb) AS item)
+        )
+        ELSE data::jsonb
+    END
+"""
+
+
 class GlobalNameResponse(msgspec.Struct):
     name: str
+
+
+class GlobalNamesBatchBody(msgspec.Struct):
+    user_ids: Annotated[list[int], msgspec.Meta(min_length=1, max_length=1000)]
+
+
+class UserGlobalNameResponse(msgspec.Struct):
+    user_id: int
+    name: str | None
@@ -1,88 +1,168 @@
-import json
-from typing import Annotated, Literal
+import asyncio
+import datetime
+from typing import Annotated, AsyncGenerator, Literal
 
-from asyncpg import Connection, Record
-from litestar import Request, get
+import msgspec
+from asyncpg import Connection
+from litestar import Request, get, post
 from litestar.exceptions import HTTPException
 from litestar.params import Parameter
+from litestar.response import ServerSentEvent, ServerSentEventMessage
+from litestar.status_codes import HTTP_503_SERVICE_UNAVAILABLE
 
-from utils.utilities import convert_num_to_difficulty
+from utils.user_names import get_global_names
 
 from ..root import BaseController
 from .models import (
+    NEWSFEED_DATA_SQL,
     GlobalNameResponse,
-    NewsfeedDataResponse,
-    NewsfeedMapResponse,
-    NewsfeedMessageResponse,
-    NewsfeedRecordResponse,
+    GlobalNamesBatchBody,
     NewsfeedResponse,
-    NewsfeedUserResponse,
+    NewsfeedStreamEvent,
+    UserGlobalNameResponse,
 )
+from .stream import MAX_CONTENT_HASH, REPLAY_LIMIT, NewsfeedHub, as_utc, parse_event_id
+
+_decode_newsfeed_page = msgspec.json.Decoder(list[NewsfeedResponse], strict=False).decode
+
+NEWSFEED_TYPES = Literal["map_edit", "guide", "new_map", "role", "record", "announcement"]
+
+_UNKNOWN_USER = object()
+
+# Sent while idle so proxies keep the stream open.
+KEEPALIVE_SECONDS = 15
+
+
+def _event_message(event: NewsfeedStreamEvent) -> ServerSentEventMessage:
+    return ServerSentEventMessage(
+        data=msgspec.json.encode(event).decode(),
+        event=event.type,
+        id=event.event_id,
+    )
 
 
 class NewsfeedController(BaseController):
     path = "/newsfeed"
     tags = ["newsfeed"]
 
-    @staticmethod
-    def _parse_newsfeed_row(row: Record) -> NewsfeedResponse:
-        type_ = row["type"]
-        timestamp = row["timestamp"]
-        data_json = row["data"]
-        total_results = row["total_results"]
-
-        data_dict = json.loads(data_json)
-
-        map_data = None
-        user_data = None
-        record_data = None
-        message_data = None
-        bulk_data = None
-
-        if isinstance(data_dict, dict):
-            user_data = NewsfeedUserResponse(**data_dict.get("user", {})) if "user" in data_dict else None
-            map_data = NewsfeedMapResponse(**data_dict.get("map", {})) if "map" in data_dict else None
-            record_data = NewsfeedRecordResponse(**data_dict.get("record", {})) if "record" in data_dict else None
-            message_data = NewsfeedMessageResponse(**data_dict.get("message", {})) if "message" in data_dict else None
-        elif isinstance(data_dict, list):
-            print(data_dict)
-            bulk_data = [NewsfeedMapResponse(**(m["map"])) for m in data_dict]
-
-        data = NewsfeedDataResponse(
-            map=map_data, user=user_data, record=record_data, message=message_data, bulk=bulk_data
-        )
-        return NewsfeedResponse(type=type_, timestamp=timestamp, data=data, total_results=total_results)
-
     @get(path="/")
     async def get_newsfeed(
         self,
         db_connection: Connection,
         page_size: Literal[10, 20, 25, 50] = 10,
         page_number: Annotated[int, Parameter(ge=1)] = 1,
-        type_: Annotated[
-            Literal["map_edit", "guide", "new_map", "role", "record", "announcement"] | None, Parameter(query="type")
-        ] = None,
+        type_: Annotated[NEWSFEED_TYPES | None, Parameter(query="type")] = None,
     ) -> list[NewsfeedResponse]:
         """Get newsfeed."""
-        query = """
+        # The page is built as one JSON document and decoded in a single pass.
+        # Duplicates are rejected on insert, so the page is read straight off the timestamp indexes.
+        # Entries past the hot horizon live in newsfeed_archive, which is only read once the page reaches past
+        # the newest entries. Its per-type counts are kept by the compaction script in newsfeed_archive_counts.
+        where = "WHERE type = $1" if type_ else ""
+        args: list[object] = [type_] if type_ else []
+        totals_query = f"""
             SELECT
-                type, timestamp, data::jsonb,
-                count(*) OVER() as total_results
-            FROM newsfeed
-            WHERE $3::text IS NULL OR type = $3
-            GROUP BY type, timestamp, data::jsonb
-            ORDER BY timestamp DESC
-            LIMIT $1
-            OFFSET $2;
-            """
+                (SELECT count(*) FROM newsfeed {where}) AS hot_total,
+                (SELECT coalesce(sum(total), 0) FROM newsfeed_archive_counts {where})::bigint AS archive_total
+        """
+        hot_total, archive_total = await db_connection.fetchrow(totals_query, *args)
+
         offset = (page_number - 1) * page_size
-        rows = await db_connection.fetch(query, page_size, offset, type_)
-        responses = []
-        for row in rows:
-            if row.get("difficulty") and isinstance(row["difficulty"], float):
-                row["difficulty"] = convert_num_to_difficulty(row["difficulty"])
-            responses.append(self._parse_newsfeed_row(row))
-        return responses
+        hot_limit = max(0, min(page_size, hot_total - offset))
+        archive_limit = page_size - hot_limit
+
+        def arg(value: object) -> str:
+            args.append(value)
+            return f"${len(args)}"
+
+        branches = []
+        if hot_limit:
+            branches.append(
+                f"(SELECT type, timestamp, data FROM newsfeed {where} "
+                f"ORDER BY timestamp DESC LIMIT {arg(hot_limit)} OFFSET {arg(offset)})"
+            )
+        if archive_limit:
+            branches.append(
+                f"(SELECT type, timestamp, data FROM newsfeed_archive {where} "
+                f"ORDER BY timestamp DESC LIMIT {arg(archive_limit)} OFFSET {arg(max(0, offset - hot_total))})"
+            )
+        if not branches:
+            return []
+
+        query = f"""
+            WITH page AS (
+                {" UNION ALL ".join(branches)}
+            )
+            SELECT coalesce(
+                json_agg(
+                    json_build_object(
+                        'type', type,
+                        'timestamp', timestamp,
+                        'data', {NEWSFEED_DATA_SQL},
+                        'total_results', {arg(hot_total + archive_total)}::bigint
+                    )
+                    ORDER BY timestamp DESC
+                )::text,
+                '[]'
+            )
+            FROM page;
+            """
+        return _decode_newsfeed_page(await db_connection.fetchval(query, *args))
+
+    @get(path="/stream")
+    async def stream_newsfeed(
+        self,
+        request: Request,
+        types: Annotated[list[NEWSFEED_TYPES] | None, Parameter(query="type")] = None,
+        since: datetime.datetime | None = None,
+    ) -> ServerSentEvent:
+        """Stream new newsfeed entries as Server-Sent Events.
+
+        Each event's id is the entry timestamp and content hash. Reconnecting with Last-Event-ID, or passing since,
+        first sends every entry published after it.
+        """
+        hub: NewsfeedHub | None = request.app.state.get("newsfeed_hub")
+        if hub is None or not hub.connected:
+            raise HTTPException(detail="Newsfeed stream is unavailable.", status_code=HTTP_503_SERVICE_UNAVAILABLE)
+        position = (since, MAX_CONTENT_HASH) if since else None
+        last_event_id = request.headers.get("last-event-id")
+        if last_event_id:
+            try:
+                position = parse_event_id(last_event_id)
+            except ValueError:
+                raise HTTPException(detail="Invalid Last-Event-ID.", status_code=400) from None
+        type_filter = set(types) if types else None
+        subscriber = hub.subscribe(type_filter)
+
+        async def _events() -> AsyncGenerator[ServerSentEventMessage, None]:
+            replayed = set()
+            try:
+                # Page through the whole backlog, each replay returns at most REPLAY_LIMIT entries.
+                page_position = position
+                while page_position:
+                    events = await hub.replay(*page_position, type_filter)
+                    for event in events:
+                        replayed.add(event.event_id)
+                        yield _event_message(event)
+                    if len(events) < REPLAY_LIMIT:
+                        break
+                    page_position = (as_utc(events[-1].timestamp), events[-1].content_hash)
+                while True:
+                    try:
+                        event = await asyncio.wait_for(subscriber.get(), KEEPALIVE_SECONDS)
+                    except asyncio.TimeoutError:
+                        yield ServerSentEventMessage(data=None, comment="keepalive")
+                        continue
+                    if event is None:
+                        return
+                    # The subscription starts before the replay, so replayed entries can also arrive live.
+                    if event.event_id in replayed:
+                        continue
+                    yield _event_message(event)
+            finally:
+                hub.unsubscribe(subscriber)
+
+        return ServerSentEvent(_events())
 
     @get(path="/discord/{user_id:int}")
     async def get_global_name(
@@ -92,10 +172,25 @@ class NewsfeedController(BaseController):
         user_id: int,
     ) -> GlobalNameResponse:
         """Get Global Name."""
-        query = "SELECT global_name AS name FROM users WHERE user_id = $1;"
-        row = await db_connection.fetchrow(query, user_id)
-        if not row:
+        name = (await get_global_names(db_connection, [user_id])).get(user_id, _UNKNOWN_USER)
+        if name is _UNKNOWN_USER:
             if request.headers.get("x-test-mode"):
                 return GlobalNameResponse(name="Test User")
             raise HTTPException(detail="User ID not found.", status_code=404)
-        return GlobalNameResponse(**row)
+        return GlobalNameResponse(name=name)
+
+    @post(path="/discord/batch")
+    async def get_global_names_batch(
+        self,
+        db_connection: Connection,
+        request: Request,
+        data: GlobalNamesBatchBody,
+    ) -> list[UserGlobalNameResponse]:
+        """Get the global names of many users, in request order. Unknown users are left out."""
+        names = await get_global_names(db_connection, data.user_ids)
+        test_mode = bool(request.headers.get("x-test-mode"))
+        return [
+            UserGlobalNameResponse(user_id=user_id, name=names.get(user_id, "Test User"))
+            for user_id in dict.fromkeys(data.user_ids)
+            if user_id in names or test_mode
+        ]
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import datetime
+import logging
+import uuid
+
+import asyncpg
+import msgspec
+
+from .models import NEWSFEED_DATA_SQL, NewsfeedStreamEvent
+
+log = logging.getLogger(__name__)
+
+NEWSFEED_CHANNEL = "newsfeed"
+# Page size when replaying entries to a reconnecting client and when the hub catches up after a reconnect.
+REPLAY_LIMIT = 100
+# Sorts after every content hash, so resuming from a bare timestamp skips every entry at that timestamp.
+MAX_CONTENT_HASH = "ffffffff-ffff-ffff-ffff-ffffffffffff"
+
+_EVENT_SQL = f"""
+    json_build_object(
+        'type', type, 'timestamp', timestamp, 'data', {NEWSFEED_DATA_SQL}, 'content_hash', content_hash
+    )
+"""
+
+_decode_events = msgspec.json.Decoder(list[NewsfeedStreamEvent], strict=False).decode
+
+
+def as_utc(timestamp: datetime.datetime) -> datetime.datetime:
+    """Treat naive timestamps as UTC so they compare with aware ones."""
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=datetime.UTC)
+
+
+def parse_event_id(event_id: str) -> tuple[datetime.datetime, str]:
+    """Split an SSE id into the entry's timestamp and content hash. A bare timestamp resumes after it."""
+    timestamp, _, content_hash = event_id.partition("/")
+    if content_hash:
+        content_hash = str(uuid.UUID(content_hash))
+    return as_utc(datetime.datetime.fromisoformat(timestamp)), content_hash or MAX_CONTENT_HASH
+
+
+class NewsfeedSubscriber:
+    """Queue of new entries for one streaming client, optionally limited to some types."""
+
+    def __init__(self, types: set[str] | None, maxsize: int = 100) -> None:
+        self.types = types
+        self.closed = False
+        self._queue: asyncio.Queue[NewsfeedStreamEvent | None] = asyncio.Queue(maxsize)
+
+    def push(self, event: NewsfeedStreamEvent) -> None:
+        """Queue an event, closing the subscriber if the client has fallen too far behind."""
+        if self.closed or (self.types is not None and event.type not in self.types):
+            return
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # The client resumes from its Last-Event-ID when it reconnects.
+            self.close()
+
+    def close(self) -> None:
+        """Stop the stream after the queued events are sent."""
+        self.closed = True
+        with contextlib.suppress(asyncio.QueueFull):
+            self._queue.put_nowait(None)
+
+    async def get(self) -> NewsfeedStreamEvent | None:
+        """Wait for the next event, None once closed."""
+        if self.closed and self._queue.empty():
+            return None
+        return await self._queue.get()
+
+
+class NewsfeedHub:
+    """Fan out new newsfeed entries from one LISTEN connection to every streaming client.
+
+    The connection is dedicated to the hub and reconnects on failure, catching up on entries
+    published while it was down.
+    """
+
+    def __init__(self, dsn: str) -> None:
+        self._dsn = dsn
+        self._conn: asyncpg.Connection | None = None
+        self._query_lock = asyncio.Lock()
+        self._notifications: asyncio.Queue[str | None] = asyncio.Queue()
+        self._subscribers: set[NewsfeedSubscriber] = set()
+        self._position: tuple[datetime.datetime, str] | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def connected(self) -> bool:
+        """Whether the LISTEN connection is up."""
+        return self._conn is not None
+
+    def start(self) -> None:
+        """Start listening in the background."""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop listening and end every stream."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+        for subscriber in self._subscribers:
+            subscriber.close()
+
+    def subscribe(self, types: set[str] | None = None) -> NewsfeedSubscriber:
+        """Register a client for new entries."""
+        subscriber = NewsfeedSubscriber(types)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: NewsfeedSubscriber) -> None:
+        """Remove a client."""
+        self._subscribers.discard(subscriber)
+
+    async def replay(
+        self,
+        since: datetime.datetime,
+        content_hash: str = MAX_CONTENT_HASH,
+        types: set[str] | None = None,
+    ) -> list[NewsfeedStreamEvent]:
+        """Get up to REPLAY_LIMIT of the oldest entries after the (timestamp, content_hash) position."""
+        query = f"""
+            SELECT coalesce(json_agg(event ORDER BY timestamp, content_hash)::text, '[]')
+            FROM (
+                SELECT timestamp, content_hash, {_EVENT_SQL} AS event
+                FROM newsfeed
+                WHERE
+                    (timestamp, content_hash) > ($1::timestamptz, $2::uuid) AND
+                    ($3::text[] IS NULL OR type = ANY($3::text[]))
+                ORDER BY timestamp, content_hash
+                LIMIT {REPLAY_LIMIT}
+            ) page
+        """
+        return _decode_events(await self._fetch(query, as_utc(since), content_hash, list(types) if types else None))
+
+    async def _fetch(self, query: str, *args: object) -> str:
+        if self._conn is None:
+            raise ConnectionError("Newsfeed hub is not connected.")
+        async with self._query_lock:
+            return await self._conn.fetchval(query, *args)
+
+    async def _fetch_by_hash(self, content_hash: str) -> list[NewsfeedStreamEvent]:
+        query = f"""
+            SELECT coalesce(json_agg({_EVENT_SQL})::text, '[]')
+            FROM newsfeed
+            WHERE content_hash = $1::uuid
+        """
+        return _decode_events(await self._fetch(query, content_hash))
+
+    def _publish(self, events: list[NewsfeedStreamEvent]) -> None:
+        for event in events:
+            position = (as_utc(event.timestamp), event.content_hash)
+            if self._position is None or position > self._position:
+                self._position = position
+            for subscriber in list(self._subscribers):
+                subscriber.push(event)
+
+    def _on_notification(self, _conn: asyncpg.Connection, _pid: int, _channel: str, payload: str) -> None:
+        self._notifications.put_nowait(payload)
+
+    def _on_termination(self, _conn: asyncpg.Connection) -> None:
+        self._notifications.put_nowait(None)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                conn = await asyncpg.connect(self._dsn)
+                try:
+                    await conn.add_listener(NEWSFEED_CHANNEL, self._on_notification)
+                    conn.add_termination_listener(self._on_termination)
+                    self._conn = conn
+                    # Catch up on everything published while disconnected, a page at a time.
+                    while self._position is not None and (missed := await self.replay(*self._position)):
+                        self._publish(missed)
+                    while (content_hash := await self._notifications.get()) is not None:
+                        self._publish(await self._fetch_by_hash(content_hash))
+                    log.warning("Newsfeed LISTEN connection closed, reconnecting")
+                finally:
+                    self._conn = None
+                    with contextlib.suppress(Exception):
+                        await conn.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Newsfeed LISTEN connection failed, reconnecting")
+                await asyncio.sleep(5)
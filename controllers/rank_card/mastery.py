@@ -1,12 +1,18 @@
 from __future__ import annotations
 
 from asyncpg import Connection  # noqa: TC002
-from litestar import get
+from litestar import get, post
 
 from utils.utilities import MAP_NAME_T  # noqa: TC001
 
 from ..root import BaseController
-from .models import MapMasteryData, fetch_map_mastery
+from .models import (
+    MapMasteryData,
+    MasteryBatchBody,
+    MultipleMapMasteryData,
+    fetch_map_mastery,
+    fetch_users_map_mastery,
+)
 
 
 class MasteryController(BaseController):
@@ -22,3 +28,12 @@ class MasteryController(BaseController):
     ) -> list[MapMasteryData]:
         """Fetch Map Mastery for a particular user."""
         return await fetch_map_mastery(db_connection, user_id, map_name)
+
+    @post(path="/batch")
+    async def fetch_users_mastery(
+        self,
+        db_connection: Connection,
+        data: MasteryBatchBody,
+    ) -> list[MultipleMapMasteryData]:
+        """Fetch Map Mastery for several users, optionally limited to some map names."""
+        return await fetch_users_map_mastery(db_connection, data.user_ids, data.map_names)
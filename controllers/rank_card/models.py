@@ -1,40 +1,80 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Literal
+import bisect
+import functools
+from typing import TYPE_CHECKING, Annotated, Literal
 
 import msgspec
 
-from utils.utilities import sanitize_string
+from utils.utilities import MAP_NAME_T, sanitize_string
 
 if TYPE_CHECKING:
+    from collections.abc import Iterable
+
     import asyncpg
 
+CARD_FORMAT_T = Literal["png", "webp", "avif"]
+CARD_SIZE_T = Literal["full", "medium", "small"]
+
 
 async def fetch_map_mastery(db: asyncpg.Connection, user_id: int, map_name: str | None = None) -> list[MapMasteryData]:
     """Fetch map mastery data for given user."""
     query = """
-                WITH minimized_records AS (
-                    SELECT DISTINCT ON (r.map_code, m.map_name)
-                        map_name
-                    FROM records r
-                    LEFT JOIN maps m ON r.map_code = m.map_code
-                    WHERE r.user_id = $1
-                ),
-                map_counts AS (
-                    SELECT map_name, count(map_name) AS amount
-                    FROM minimized_records
-                    GROUP BY map_name
-                )
-                SELECT
-                    amn.name as map_name,
-                    COALESCE(mc.amount, 0) AS amount
-                FROM all_map_names amn
-                LEFT JOIN map_counts mc ON mc.map_name = amn.name
-                WHERE ($2::text IS NULL OR amn.name = $2) and amn.name != 'Adlersbrunn'
-                ORDER BY amn.name;
-            """
+        SELECT
+            amn.name AS map_name,
+            coalesce(mmc.amount, 0) AS amount
+        FROM all_map_names amn
+        LEFT JOIN map_mastery_counts mmc ON mmc.map_name = amn.name AND mmc.user_id = $1
+        WHERE ($2::text IS NULL OR amn.name = $2) AND amn.name != 'Adlersbrunn'
+        ORDER BY amn.name;
+    """
     rows = await db.fetch(query, user_id, map_name)
-    return [MapMasteryData(**row) for row in rows]
+    return build_map_mastery(rows)
+
+
+async def fetch_users_map_mastery(
+    db: asyncpg.Connection, user_ids: list[int], map_names: list[str] | None = None
+) -> list[MultipleMapMasteryData]:
+    """Fetch map mastery data for several users at once."""
+    query = """
+        SELECT
+            u.user_id,
+            amn.name AS map_name,
+            coalesce(mmc.amount, 0) AS amount
+        FROM unnest($1::bigint[]) AS u(user_id)
+        CROSS JOIN all_map_names amn
+        LEFT JOIN map_mastery_counts mmc ON mmc.map_name = amn.name AND mmc.user_id = u.user_id
+        WHERE ($2::text[] IS NULL OR amn.name = ANY($2::text[])) AND amn.name != 'Adlersbrunn'
+        ORDER BY u.user_id, amn.name;
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    rows = await db.fetch(query, user_ids, map_names)
+    grouped: dict[int, list[tuple[str, int]]] = {user_id: [] for user_id in user_ids}
+    for user_id, map_name, amount in rows:
+        grouped[user_id].append((map_name, amount))
+    return [MultipleMapMasteryData(user_id, build_map_mastery(data)) for user_id, data in grouped.items()]
+
+
+_MASTERY_THRESHOLDS = (0, 5, 10, 15, 20, 25, 30)
+_MASTERY_LEVELS = ("Placeholder", "Rookie", "Explorer", "Trailblazer", "Pathfinder", "Specialist", "Prodigy")
+
+
+def _mastery_level(amount: int) -> str:
+    return _MASTERY_LEVELS[max(bisect.bisect_right(_MASTERY_THRESHOLDS, amount) - 1, 0)]
+
+
+@functools.cache
+def _mastery_icon_url(map_name: str, level: str) -> str:
+    return f"assets/mastery/{sanitize_string(map_name)}_{level.lower()}.webp"
+
+
+def build_map_mastery(rows: Iterable[asyncpg.Record | tuple[str, int]]) -> list[MapMasteryData]:
+    """Derive level and icon url for (map_name, amount) rows in a single pass."""
+    result = []
+    for map_name, amount in rows:
+        level = _mastery_level(amount)
+        result.append(MapMasteryData(map_name, amount, level, _mastery_icon_url(map_name, level)))
+    return result
 
 
 class RankDetail(msgspec.Struct):
@@ -113,6 +153,12 @@ class RankCardData(msgspec.Struct):
         )
 
 
+class RankCardBatchBody(msgspec.Struct):
+    user_ids: Annotated[list[int], msgspec.Meta(min_length=1, max_length=100)]
+    format: CARD_FORMAT_T = "png"
+    size: CARD_SIZE_T = "full"
+
+
 class RankCardBadgeSettingsBody(msgspec.Struct):
     user_id: int
     badge_name1: str | None = None
@@ -144,30 +190,10 @@ class MapMasteryData(msgspec.Struct):
 
     def __post_init__(self) -> None:
         """Post init."""
-        self.level = self._level()
-        self.icon_url = self._icon_url()
-
-    def _level(self) -> str:
-        thresholds = [
-            (0, "Placeholder"),
-            (5, "Rookie"),
-            (10, "Explorer"),
-            (15, "Trailblazer"),
-            (20, "Pathfinder"),
-            (25, "Specialist"),
-            (30, "Prodigy"),
-        ]
-
-        icon_name = "Placeholder"
-        for threshold, name in thresholds:
-            if self.amount >= threshold:
-                icon_name = name
-        return icon_name
-
-    def _icon_url(self) -> str:
-        _sanitized_map_name = sanitize_string(self.map_name)
-        _lowered_level = self.level.lower()
-        return f"assets/mastery/{_sanitized_map_name}_{_lowered_level}.webp"
+        if self.level is None:
+            self.level = _mastery_level(self.amount)
+        if self.icon_url is None:
+            self.icon_url = _mastery_icon_url(self.map_name, self.level)
 
 
 class MultipleMapMasteryData(msgspec.Struct):
@@ -175,6 +201,11 @@ class MultipleMapMasteryData(msgspec.Struct):
     data: list[MapMasteryData]
 
 
+class MasteryBatchBody(msgspec.Struct):
+    user_ids: Annotated[list[int], msgspec.Meta(min_length=1, max_length=1000)]
+    map_names: list[MAP_NAME_T] | None = None
+
+
 class BackgroundResponse(msgspec.Struct):
     name: str | None
     url: str = None
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import os
+from typing import TYPE_CHECKING, Callable
+
+import asyncpg
+import msgspec
+
+from utils.user_names import invalidate_user_names
+
+from .utils import RankCardBuilder, fetch_rank_card_data, fetch_rank_card_versions, rendered_cards
+
+if TYPE_CHECKING:
+    import aio_pika
+    from aio_pika.pool import Pool
+    from litestar.datastructures import State
+
+log = logging.getLogger(__name__)
+
+RANK_CARD_EVENTS_QUEUE = os.getenv("RANK_CARD_EVENTS_QUEUE", "genjiapi.rank_card")
+# Notified with a user_id by the triggers in migrations/009_rank_card_versions.sql, whoever wrote the change.
+RANK_CARD_CHANNEL = "rank_card"
+# Events for users whose names changed, which also drop their cached global names.
+USER_NAME_EVENTS = frozenset({"user_name_change"})
+
+
+class UserChangeEvent(msgspec.Struct):
+    """Body of a record, rank or settings change event for one or more users."""
+
+    user_ids: list[int] = msgspec.field(default_factory=list)
+    user_id: int | None = None
+
+    def affected_users(self) -> list[int]:
+        """Get every user_id referenced by the event."""
+        if self.user_id is None:
+            return self.user_ids
+        return [self.user_id, *self.user_ids]
+
+
+class RankCardPrerenderer:
+    """Re-render and cache rank cards for users whose data changed, off the request path.
+
+    Changes are picked up from the rank_card notification channel, which database triggers publish for every
+    writer including the bot, and from the RabbitMQ events queue. Only cards that are already cached are warmed.
+    This is only a warm-up path, fetch_rank_card checks every cached render against the current versions.
+
+    Pending users are deduplicated, so a burst of events for the same user renders once,
+    and at most ``concurrency`` renders run at a time.
+    """
+
+    def __init__(
+        self, pool_provider: Callable[[], asyncpg.Pool], dsn: str | None = None, concurrency: int = 2
+    ) -> None:
+        self._pool_provider = pool_provider
+        self._dsn = dsn
+        self._queue: asyncio.Queue[int] = asyncio.Queue()
+        self._pending: set[int] = set()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks: set[asyncio.Task] = set()
+
+    def enqueue(self, *user_ids: int) -> None:
+        """Invalidate cached cards and schedule them to be rendered again."""
+        for user_id in user_ids:
+            rendered_cards.pop(user_id)
+            if user_id in self._pending:
+                continue
+            self._pending.add(user_id)
+            self._queue.put_nowait(user_id)
+
+    def start(self, channel_pool: Pool | None) -> None:
+        """Start the render loop, the change listener and, when RabbitMQ is configured, the event consumer."""
+        self._spawn(self._render_loop())
+        if self._dsn is not None:
+            self._spawn(self._listen())
+        if channel_pool is not None:
+            self._spawn(self._consume(channel_pool))
+
+    async def stop(self) -> None:
+        """Cancel the render loop, consumer and any renders in flight."""
+        for task in self._tasks:
+            task.cancel()
+        for task in list(self._tasks):
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    def _spawn(self, coro) -> None:  # noqa: ANN001
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _render_loop(self) -> None:
+        while True:
+            user_id = await self._queue.get()
+            await self._semaphore.acquire()
+            # Changes that arrive while this render runs queue a fresh one.
+            self._pending.discard(user_id)
+            self._spawn(self._render(user_id))
+
+    async def _render(self, user_id: int) -> None:
+        try:
+            async with self._pool_provider().acquire() as conn:
+                # Read before the data, so a change made meanwhile leaves the render behind the current version.
+                versions = (await fetch_rank_card_versions(conn, [user_id]))[user_id]
+                data = (await fetch_rank_card_data(conn, [user_id], versions[0]))[user_id]
+            image = await asyncio.to_thread(RankCardBuilder(data).create_card)
+            if user_id not in self._pending:
+                rendered_cards.set(user_id, (versions, image))
+        except Exception:
+            log.exception("Failed to pre-render rank card for user %s", user_id)
+        finally:
+            self._semaphore.release()
+
+    def _on_notification(self, _conn: asyncpg.Connection, _pid: int, _channel: str, payload: str) -> None:
+        user_id = int(payload)
+        if user_id in rendered_cards:
+            self.enqueue(user_id)
+
+    async def _listen(self) -> None:
+        while True:
+            closed = asyncio.Event()
+            try:
+                conn = await asyncpg.connect(self._dsn)
+                try:
+                    conn.add_termination_listener(lambda _conn: closed.set())
+                    await conn.add_listener(RANK_CARD_CHANNEL, self._on_notification)
+                    await closed.wait()
+                    log.warning("Rank card LISTEN connection closed, reconnecting")
+                finally:
+                    with contextlib.suppress(Exception):
+                        await conn.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Rank card LISTEN connection failed, reconnecting")
+                await asyncio.sleep(5)
+
+    async def _consume(self, channel_pool: Pool) -> None:
+        while True:
+            try:
+                async with channel_pool.acquire() as channel:  # type: aio_pika.Channel
+                    queue = await channel.declare_queue(RANK_CARD_EVENTS_QUEUE, durable=True)
+                    async with queue.iterator() as messages:
+                        async for message in messages:
+                            async with message.process():
+                                self._handle_message(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Rank card event consumer stopped, reconnecting")
+                await asyncio.sleep(5)
+
+    def _handle_message(self, message: aio_pika.abc.AbstractIncomingMessage) -> None:
+        try:
+            event = msgspec.json.decode(message.body, type=UserChangeEvent)
+        except msgspec.DecodeError:
+            log.warning("Ignoring malformed %s event: %r", message.headers.get("x-type"), message.body)
+            return
+        if message.headers.get("x-type") in USER_NAME_EVENTS:
+            invalidate_user_names(*event.affected_users())
+        self.enqueue(*event.affected_users())
+
+
+def schedule_rank_card_render(state: State, *user_ids: int) -> None:
+    """Invalidate cached rank cards and pre-render them when the worker is running."""
+    prerenderer: RankCardPrerenderer | None = state.get("rank_card_prerenderer")
+    if prerenderer is None:
+        for user_id in user_ids:
+            rendered_cards.pop(user_id)
+        return
+    prerenderer.enqueue(*user_ids)
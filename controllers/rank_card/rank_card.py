@@ -1,12 +1,20 @@
 from __future__ import annotations
 
 import asyncio
-import io
+import hashlib
+import uuid
+from typing import TYPE_CHECKING, Annotated, AsyncGenerator
 
 import asyncpg  # noqa: TC002
-from litestar import Controller, get, post
+import msgspec
+from litestar import Controller, MediaType, Request, Response, get, post
+from litestar.params import Parameter
 from litestar.response import Stream
+from litestar.status_codes import HTTP_304_NOT_MODIFIED
+from markupsafe import Markup
 
+from utils.map_totals import get_map_totals
+from utils.settings_cache import get_profile_setting, get_user_setting, invalidate_user_settings
 from utils.utilities import sanitize_string
 
 from .models import (
@@ -14,10 +22,52 @@ from .models import (
     BackgroundResponse,
     RankCardBadgesData,
     RankCardBadgeSettingsBody,
+    RankCardBatchBody,
     RankCardData,
     fetch_map_mastery,
 )
-from .utils import RankCardBuilder, fetch_user_rank_data, find_highest_rank
+from .utils import (
+    CARD_FORMAT_T,
+    CARD_SIZE_T,
+    RankCardBuilder,
+    card_media_type,
+    encode_card,
+    fetch_maps_counts,
+    fetch_nicknames,
+    fetch_playtests_counts,
+    fetch_rank_card_data,
+    fetch_rank_card_versions,
+    fetch_users_rank_data,
+    fetch_world_record_counts,
+    find_highest_rank,
+    negotiate_card_format,
+    render_cards_in_pool,
+    rendered_cards,
+)
+
+if TYPE_CHECKING:
+    from jinja2 import Template
+    from litestar.contrib.jinja import JinjaTemplateEngine
+
+
+_compiled_templates: dict[str, tuple[Template, bytes]] = {}
+_static_fragments: dict[str, Markup] = {}
+
+
+def _compiled_template(engine: JinjaTemplateEngine, name: str) -> tuple[Template, bytes]:
+    """Get a compiled template along with a digest of its source, used to version ETags."""
+    if name not in _compiled_templates:
+        template = engine.get_template(name)
+        source, _, _ = engine.engine.loader.get_source(engine.engine, name)
+        _compiled_templates[name] = (template, hashlib.blake2b(source.encode(), digest_size=8).digest())
+    return _compiled_templates[name]
+
+
+def _static_fragment(engine: JinjaTemplateEngine, name: str) -> Markup:
+    """Render a template without context once and reuse the output."""
+    if name not in _static_fragments:
+        _static_fragments[name] = Markup(engine.get_template(name).render())
+    return _static_fragments[name]
 
 
 class RankCardController(Controller):
@@ -37,13 +87,13 @@ class RankCardController(Controller):
             ON CONFLICT (user_id) DO UPDATE SET name = EXCLUDED.name;
         """
         await db_connection.execute(query, user_id, background)
+        invalidate_user_settings(user_id, "background")
         return BackgroundResponse(name=background)
 
     @get(path="/settings/background/{user_id:int}")
     async def get_background(self, db_connection: asyncpg.Connection, user_id: int) -> BackgroundResponse:
         """Get user background."""
-        query = "SELECT name FROM rank_card_background WHERE user_id = $1;"
-        background = await db_connection.fetchval(query, user_id)
+        background = await get_profile_setting(db_connection, user_id, "background")
         return BackgroundResponse(name=background)
 
     @post(path="/settings/avatar/skin/{user_id:int}/{skin:str}")
@@ -54,13 +104,13 @@ class RankCardController(Controller):
                     ON CONFLICT (user_id) DO UPDATE SET skin = EXCLUDED.skin;
                 """
         await db_connection.execute(query, user_id, skin)
+        invalidate_user_settings(user_id, "skin")
         return AvatarResponse(skin=skin)
 
     @get(path="/settings/avatar/skin/{user_id:int}")
     async def get_avatar_skin(self, db_connection: asyncpg.Connection, user_id: int) -> AvatarResponse:
         """Get user avatar Skin."""
-        query = "SELECT skin FROM rank_card_avatar WHERE user_id = $1;"
-        skin = await db_connection.fetchval(query, user_id)
+        skin = await get_profile_setting(db_connection, user_id, "skin")
         return AvatarResponse(skin=skin)
 
     @post(path="/settings/avatar/pose/{user_id:int}/{pose:str}")
@@ -71,20 +121,19 @@ class RankCardController(Controller):
             ON CONFLICT (user_id) DO UPDATE SET pose = EXCLUDED.pose;
         """
         await db_connection.execute(query, user_id, pose)
+        invalidate_user_settings(user_id, "pose")
         return AvatarResponse(pose=pose)
 
     @get(path="/settings/avatar/pose/{user_id:int}")
     async def get_avatar_pose(self, db_connection: asyncpg.Connection, user_id: int) -> AvatarResponse:
         """Get user avatar Skin."""
-        query = "SELECT pose FROM rank_card_avatar WHERE user_id = $1;"
-        pose = await db_connection.fetchval(query, user_id)
+        pose = await get_profile_setting(db_connection, user_id, "pose")
         return AvatarResponse(pose=pose)
 
     @get(path="/settings/badges/{user_id:int}")
     async def fetch_badges_settings(self, db_connection: asyncpg.Connection, user_id: int) -> RankCardBadgeSettingsBody:
         """Fetch current badges settings."""
-        query = "SELECT * FROM rank_card_badges WHERE user_id = $1;"
-        row = await db_connection.fetchrow(query, user_id)
+        row = await get_user_setting(user_id, "badges", lambda: self._fetch_badges_row(db_connection, user_id))
         if not row:
             return RankCardBadgeSettingsBody(user_id=user_id)
         row_d = {**row}
@@ -151,8 +200,14 @@ class RankCardController(Controller):
             data.badge_name6,
             data.badge_type6,
         )
+        invalidate_user_settings(user_id, "badges")
         return data
 
+    @staticmethod
+    async def _fetch_badges_row(db_connection: asyncpg.Connection, user_id: int) -> dict | None:
+        row = await db_connection.fetchrow("SELECT * FROM rank_card_badges WHERE user_id = $1;", user_id)
+        return dict(row) if row else None
+
     async def _fetch_community_rank_xp(self, conn: asyncpg.Connection, user_id: int) -> asyncpg.Record:
         query = """
             SELECT
@@ -174,20 +229,48 @@ class RankCardController(Controller):
         user_id: int,
     ) -> RankCardData:
         """Fetch rank card test."""
-        totals = await self._get_map_totals_no_beginner(db_connection)
-        rank_data = await fetch_user_rank_data(db_connection, user_id, True, False)
-        world_records = await self._get_world_record_count(db_connection, user_id)
-        maps = await self._get_maps_count(db_connection, user_id)
-        playtests = await self._get_playtests_count(db_connection, user_id)
+        return await self._fetch_rank_card_data(db_connection, user_id)
+
+    @get(path="/html/{user_id:int}")
+    async def fetch_rank_card_html(
+        self,
+        request: Request,
+        db_connection: asyncpg.Connection,
+        user_id: int,
+    ) -> Response[str]:
+        """Fetch rank card as server rendered HTML.
+
+        Responds with 304 Not Modified when the If-None-Match header matches the current card.
+        """
+        card = await self._fetch_rank_card_data(db_connection, user_id)
+        template, template_version = _compiled_template(request.app.template_engine, "rank_card.html")
+        etag = f'"{hashlib.blake2b(template_version + msgspec.json.encode(card), digest_size=16).hexdigest()}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(content="", status_code=HTTP_304_NOT_MODIFIED, headers=headers)
+
+        head = _static_fragment(request.app.template_engine, "rank_card_head.html")
+        return Response(
+            content=template.render(card=card, head=head),
+            media_type=MediaType.HTML,
+            headers=headers,
+        )
+
+    async def _fetch_rank_card_data(self, db_connection: asyncpg.Connection, user_id: int) -> RankCardData:
+        totals = await get_map_totals(db_connection, include_beginner=False)
+        rank_data = (await fetch_users_rank_data(db_connection, [user_id], True, False))[user_id]
+        world_records = (await fetch_world_record_counts(db_connection, [user_id])).get(user_id, 0)
+        maps = (await fetch_maps_counts(db_connection, [user_id])).get(user_id, 0)
+        playtests = (await fetch_playtests_counts(db_connection, [user_id])).get(user_id, 0)
         rank = find_highest_rank(rank_data)
         background = await self._get_background_choice(db_connection, user_id)
-        nickname = await self._fetch_nickname(db_connection, user_id)
-        avatar = await db_connection.fetchrow("SELECT * FROM rank_card_avatar WHERE user_id = $1;", user_id)
+        nickname = (await fetch_nicknames(db_connection, [user_id])).get(user_id)
+        avatar = {
+            "skin": await get_profile_setting(db_connection, user_id, "skin") or "Overwatch 1",
+            "pose": await get_profile_setting(db_connection, user_id, "pose") or "Heroic",
+        }
         _xp_data = await self._fetch_community_rank_xp(db_connection, user_id)
 
-        if not avatar:
-            avatar = {"skin": "Overwatch 1", "pose": "Heroic"}
-
         data = {
             "rank_name": rank,
             "nickname": nickname,
@@ -212,10 +295,9 @@ class RankCardController(Controller):
                 "bronze": row.bronze,
             }
 
-        for total in totals:
-            data["difficulties"][total["name"]]["total"] = total["total"]
-        _d = RankCardData(**data)
-        return _d
+        for name, total in totals.items():
+            data["difficulties"][name]["total"] = total
+        return RankCardData(**data)
 
     async def _fetch_rank_card_badge_data(
         self,
@@ -250,153 +332,64 @@ class RankCardController(Controller):
     @get(path="/{user_id:int}")
     async def fetch_rank_card(
         self,
+        request: Request,
         db_connection: asyncpg.Connection,
         user_id: int,
-    ) -> Stream:
-        """Fetch rank card."""
-        totals = await self._get_map_totals(db_connection)
-        rank_data = await fetch_user_rank_data(db_connection, user_id, True, True)
-
-        world_records = await self._get_world_record_count(db_connection, user_id)
-        maps = await self._get_maps_count(db_connection, user_id)
-        playtests = await self._get_playtests_count(db_connection, user_id)
-
-        rank = find_highest_rank(rank_data)
-
-        background = 1
-        nickname = await self._fetch_nickname(db_connection, user_id)
-
-        data = {
-            "rank": rank,
-            "name": nickname,
-            "bg": background,
-            "maps": maps,
-            "playtests": playtests,
-            "world_records": world_records,
-        }
-
-        for row in rank_data:
-            data[row.difficulty] = {
-                "completed": row.completions,
-                "gold": row.gold,
-                "silver": row.silver,
-                "bronze": row.bronze,
-            }
-
-        data["Beginner"] = {
-            "completed": 0,
-            "gold": 0,
-            "silver": 0,
-            "bronze": 0,
-        }
-
-        for total in totals:
-            data[total["name"]]["total"] = total["total"]
-        image = await asyncio.to_thread(RankCardBuilder(data).create_card)
-
-        buf = io.BytesIO()
-        image.save(buf, format="png")
-        buf.seek(0)
-
-        return Stream(
-            content=buf,
-            headers={"Content-Disposition": "inline"},
-            media_type="image/png",
-        )
-
-    @staticmethod
-    async def _fetch_nickname(db_connection, user_id):
-        nickname_query = """
-             WITH default_name AS (
-                 SELECT nickname, user_id
-                 FROM users
-             )
-             SELECT coalesce(own.username, dn.nickname) AS nickname
-             FROM default_name dn
-             LEFT JOIN user_overwatch_usernames own ON own.user_id = dn.user_id AND own.is_primary = TRUE
-             WHERE dn.user_id = $1;
-         """
-        return await db_connection.fetchval(nickname_query, user_id)
-
-
-    @staticmethod
-    async def _get_map_totals_no_beginner(conn: asyncpg.Connection) -> list[asyncpg.Record]:
-        query = """
-                WITH ranges ("range", "name") AS (
-                     VALUES
-                             ('[0.0,2.35)'::numrange, 'Easy'),
-                             ('[2.35,4.12)'::numrange, 'Medium'),
-                             ('[4.12,5.88)'::numrange, 'Hard'),
-                             ('[5.88,7.65)'::numrange, 'Very Hard'),
-                             ('[7.65,9.41)'::numrange, 'Extreme'),
-                             ('[9.41,10.0]'::numrange, 'Hell')
-                ), map_data AS
-                (SELECT avg(difficulty) as difficulty FROM maps m
-                LEFT JOIN map_ratings mr ON m.map_code = mr.map_code WHERE m.official = TRUE
-                        AND m.archived = FALSE GROUP BY m.map_code)
-                SELECT name, count(name) as total FROM map_data md
-                INNER JOIN ranges r ON r.range @> md.difficulty
-                GROUP BY name
-            """
-        return await conn.fetch(query)
-
-    @staticmethod
-    async def _get_map_totals(conn: asyncpg.Connection) -> list[asyncpg.Record]:
-        query = """
-            WITH ranges ("range", "name") AS (
-                 VALUES  ('[0,0.59)'::numrange, 'Beginner'),
-                         ('[0.59,2.35)'::numrange, 'Easy'),
-                         ('[2.35,4.12)'::numrange, 'Medium'),
-                         ('[4.12,5.88)'::numrange, 'Hard'),
-                         ('[5.88,7.65)'::numrange, 'Very Hard'),
-                         ('[7.65,9.41)'::numrange, 'Extreme'),
-                         ('[9.41,10.0]'::numrange, 'Hell')
-            ), map_data AS
-            (SELECT avg(difficulty) as difficulty FROM maps m
-            LEFT JOIN map_ratings mr ON m.map_code = mr.map_code WHERE m.official = TRUE
-                    AND m.archived = FALSE GROUP BY m.map_code)
-            SELECT name, count(name) as total FROM map_data md
-            INNER JOIN ranges r ON r.range @> md.difficulty
-            GROUP BY name
+        format_: Annotated[CARD_FORMAT_T | None, Parameter(query="format")] = None,
+        size: CARD_SIZE_T = "full",
+    ) -> Response[bytes]:
+        """Fetch rank card.
+
+        The image format is taken from `format` or negotiated from the Accept header, defaulting to PNG.
+        Smaller sizes are resampled from the full size render, which is cached per user and reused while the
+        user's rank card version and the global one are unchanged.
         """
-        return await conn.fetch(query)
+        versions = (await fetch_rank_card_versions(db_connection, [user_id]))[user_id]
+        cached = rendered_cards.get(user_id)
+        if cached and cached[0] == versions:
+            image = cached[1]
+        else:
+            data = (await fetch_rank_card_data(db_connection, [user_id], versions[0]))[user_id]
+            image = await asyncio.to_thread(RankCardBuilder(data).create_card)
+            rendered_cards.set(user_id, (versions, image))
+
+        card_format = negotiate_card_format(request.headers.get("accept"), format_)
+        content = await asyncio.to_thread(encode_card, image, card_format, size)
+
+        return Response(
+            content=content,
+            headers={"Content-Disposition": "inline", "Vary": "Accept"},
+            media_type=card_media_type(card_format),
+        )
 
-    @staticmethod
-    async def _get_world_record_count(conn: asyncpg.Connection, user_id: int) -> int:
-        query = """
-            WITH all_records AS (
-                SELECT
-                    user_id,
-                    r.map_code,
-                    record,
-                    rank() OVER (
-                        PARTITION BY r.map_code
-                        ORDER BY record
-                    ) as pos
-                FROM records r
-                LEFT JOIN maps m on r.map_code = m.map_code
-                WHERE m.official = TRUE AND record < 99999999 AND video IS NOT NULL
-            )
-            SELECT count(*) FROM all_records WHERE user_id = $1 AND pos = 1
-        """
-        return await conn.fetchval(query, user_id)
+    @post(path="/batch")
+    async def fetch_rank_card_batch(
+        self,
+        db_connection: asyncpg.Connection,
+        data: RankCardBatchBody,
+    ) -> Stream:
+        """Fetch rank cards for several users.
 
-    @staticmethod
-    async def _get_maps_count(conn: asyncpg.Connection, user_id: int) -> int:
-        query = """
-            SELECT count(*)
-            FROM maps
-            LEFT JOIN map_creators mc ON maps.map_code = mc.map_code
-            WHERE user_id = $1 AND official = TRUE
+        Cards are rendered across a worker pool and streamed back as multipart/mixed parts in the order they finish.
         """
-        return await conn.fetchval(query, user_id)
-
-    @staticmethod
-    async def _get_playtests_count(conn: asyncpg.Connection, user_id: int) -> int:
-        query = "SELECT amount FROM playtest_count WHERE user_id = $1"
-        return await conn.fetchval(query, user_id) or 0
+        cards = await fetch_rank_card_data(db_connection, data.user_ids)
+        boundary = uuid.uuid4().hex
+        media_type = card_media_type(data.format)
+
+        async def _parts() -> AsyncGenerator[bytes, None]:
+            async for user_id, content in render_cards_in_pool(cards, data.format, data.size):
+                headers = (
+                    f"--{boundary}\r\n"
+                    f"Content-Type: {media_type}\r\n"
+                    f'Content-Disposition: inline; filename="{user_id}.{data.format}"\r\n'
+                    f"X-User-Id: {user_id}\r\n"
+                    f"Content-Length: {len(content)}\r\n\r\n"
+                )
+                yield headers.encode() + content + b"\r\n"
+            yield f"--{boundary}--\r\n".encode()
+
+        return Stream(content=_parts(), media_type=f"multipart/mixed; boundary={boundary}")
 
     @staticmethod
     async def _get_background_choice(conn: asyncpg.Connection, user_id: int) -> int:
-        query = "SELECT name FROM rank_card_background WHERE user_id = $1"
-        return await conn.fetchval(query, user_id) or "placeholder"
+        return await get_profile_setting(conn, user_id, "background") or "placeholder"
@@ -1,9 +1,22 @@
+import asyncio
+import io
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache
+from pathlib import Path
+from typing import AsyncGenerator
+
 import asyncpg
 import imagetext_py as ipy
 from PIL import Image, ImageDraw, ImageFont
 from PIL.ImageFont import FreeTypeFont
 
-from .models import RankDetail
+from utils.cache import LRUCache
+from utils.map_totals import get_map_totals
+
+from .models import CARD_FORMAT_T, CARD_SIZE_T, RankDetail
 
 _COMPLETION_BAR_TOTAL_LENGTH = 325
 _COMPLETION_BAR_X_POSITION = 109
@@ -64,7 +77,31 @@ RANKS = (
     "God",
 )
 
-ipy.FontDB.LoadFromDir("./assets")
+_CARD_FORMATS: dict[str, tuple[str, str, dict]] = {
+    "png": ("PNG", "image/png", {}),
+    "webp": ("WEBP", "image/webp", {"quality": 90, "method": 4}),
+    "avif": ("AVIF", "image/avif", {"quality": 80}),
+}
+
+CARD_SIZES: dict[str, tuple[int, int]] = {
+    "full": (1000, 500),
+    "medium": (500, 250),
+    "small": (250, 125),
+}
+
+Image.init()
+SUPPORTED_CARD_FORMATS = tuple(fmt for fmt, (pil_format, _, _) in _CARD_FORMATS.items() if pil_format in Image.SAVE)
+
+# Full size renders keyed by user_id, stored with the (global, user) rank card versions read before drawing them.
+# A cached render is only served while both versions are unchanged, see migrations/009_rank_card_versions.sql.
+rendered_cards: LRUCache[int, tuple[tuple[int, int], Image.Image]] = LRUCache(
+    maxsize=int(os.getenv("RANK_CARD_CACHE_SIZE", "256")), ttl=float(os.getenv("RANK_CARD_CACHE_TTL", "900"))
+)
+
+# Resolved from this file so the module imports from any working directory.
+ASSETS_DIR = Path(__file__).resolve().parents[2] / "assets"
+
+ipy.FontDB.LoadFromDir(str(ASSETS_DIR))
 try:
     font = ipy.FontDB.Query("notosans china1 china2 japanese korean")
 except ValueError as e:
@@ -72,16 +109,56 @@ except ValueError as e:
     # Provide a fallback or skip font-specific operations
     font = None
 
+_SMALL_FONT = ImageFont.truetype(ASSETS_DIR / "Calibri.ttf", 20)
+_LARGE_FONT = ImageFont.truetype(ASSETS_DIR / "Calibri.ttf", 30)
+
+_TEXT_FILL = (255, 255, 255, 255)
+
+
+class GlyphAtlas:
+    """Pre-rasterized glyph masks and advance widths for the characters used in numeric labels."""
+
+    def __init__(self, glyph_font: FreeTypeFont, characters: str = "0123456789/") -> None:
+        self.font = glyph_font
+        self._advances: dict[str, float] = {}
+        self._glyphs: dict[str, tuple[int, Image.Image]] = {}
+        for char in characters:
+            advance = glyph_font.getlength(char)
+            left, _, right, bottom = glyph_font.getbbox(char)
+            offset = min(left, 0)
+            mask = Image.new("L", (max(right, math.ceil(advance)) - offset, bottom))
+            ImageDraw.Draw(mask).text((-offset, 0), char, font=glyph_font, fill=255)
+            self._advances[char] = advance
+            self._glyphs[char] = (offset, mask)
+
+    def supports(self, text: str) -> bool:
+        """Check whether every character of text is in the atlas."""
+        return all(char in self._glyphs for char in text)
+
+    def text_length(self, text: str) -> float:
+        """Get the advance width of text."""
+        return sum(self._advances[char] for char in text)
+
+    def draw(self, image: Image.Image, xy: tuple[float, float], text: str, fill: tuple[int, ...]) -> None:
+        """Blit text onto image with its top left corner at xy."""
+        x, y = xy
+        for char in text:
+            offset, mask = self._glyphs[char]
+            image.paste(fill, (round(x) + offset, round(y)), mask)
+            x += self._advances[char]
+
+
+_SMALL_ATLAS = GlyphAtlas(_SMALL_FONT)
+_LARGE_ATLAS = GlyphAtlas(_LARGE_FONT)
+
 
 class RankCardBuilder:
     def __init__(self, data: dict) -> None:
         self._data = data
 
-        self._rank_card = Image.open(f"assets/layer0/{self._data['bg']}.png").convert("RGBA")
+        self._rank_card = Image.open(ASSETS_DIR / "layer0" / f"{self._data['bg']}.png").convert("RGBA")
         self._draw = ImageDraw.Draw(self._rank_card)
-        self._small_font = ImageFont.truetype("assets/Calibri.ttf", 20)
-        self._large_font = ImageFont.truetype("assets/Calibri.ttf", 30)
-        self._name_font = ImageFont.truetype("assets/Calibri.ttf", 30)
+        self._large_font = _LARGE_FONT
 
     def create_card(self) -> Image:
         """Create card."""
@@ -106,21 +183,15 @@ class RankCardBuilder:
         return self._rank_card
 
     def _add_layer1(self) -> None:
-        self._paste_transparent_image("assets/layer1.png")
+        self._paste_transparent_image(ASSETS_DIR / "layer1.png")
 
     def _add_layer2(self) -> None:
-        self._paste_transparent_image("assets/layer2.png")
+        self._paste_transparent_image(ASSETS_DIR / "layer2.png")
 
     def _add_completion_labels(self, category: str, completed: int, total: int) -> None:
         y_position = _COMPLETION_BAR_Y_POSITIONS[category]
         text = f"{completed}/{total}"
-        position = self._get_center_x_position(_LABEL_WIDTH, _LABEL_X_POSITION, text, self._small_font)
-        self._draw.text(
-            (position, y_position + _COMPLETION_BAR_HEIGHT // 4),
-            text,
-            font=self._small_font,
-            fill=(255, 255, 255),
-        )
+        self._draw_label(text, _LABEL_WIDTH, _LABEL_X_POSITION, y_position + _COMPLETION_BAR_HEIGHT // 4, _SMALL_ATLAS)
 
     def _create_completion_bar(self, category: str, ratio: float) -> None:
         y_position = _COMPLETION_BAR_Y_POSITIONS[category]
@@ -146,52 +217,35 @@ class RankCardBuilder:
     def _add_completion_medals(self, category: str, medal: str) -> None:
         y_position = _COMPLETION_BAR_Y_POSITIONS[category]
         text = f"{self._data[category][medal]}"
-        position = self._get_center_x_position(_MEDAL_BOX_WIDTH, _MEDAL_X_POSITIONS[medal], text, self._small_font)
-
-        self._draw.text(
-            (position, y_position + _COMPLETION_BAR_HEIGHT // 4),
-            text,
-            font=self._small_font,
-            fill=(255, 255, 255),
+        self._draw_label(
+            text, _MEDAL_BOX_WIDTH, _MEDAL_X_POSITIONS[medal], y_position + _COMPLETION_BAR_HEIGHT // 4, _SMALL_ATLAS
         )
 
     def _add_rank_emblem(self) -> None:
-        self._paste_transparent_image(f"assets/layer3/{self._data['rank'].lower()}.png")
+        self._paste_transparent_image(ASSETS_DIR / "layer3" / f"{self._data['rank'].lower()}.png")
 
-    def _paste_transparent_image(self, path: str) -> None:
+    def _paste_transparent_image(self, path: Path) -> None:
         layer = Image.open(path).convert("RGBA")
         self._rank_card.paste(layer, None, layer)
 
     def _draw_maps_count(self) -> None:
         text = f"{self._data['maps']}"
-        position = self._get_center_x_position(_MISC_DATA_WIDTH, _MAP_COUNT_X_POSITION, text, self._large_font)
-        self._draw.text(
-            (position, _MISC_DATA_Y_POSITION + (_MISC_DATA_HEIGHT // 4)),
-            text,
-            font=self._large_font,
-            fill=(255, 255, 255),
-        )
+        y_position = _MISC_DATA_Y_POSITION + (_MISC_DATA_HEIGHT // 4)
+        self._draw_label(text, _MISC_DATA_WIDTH, _MAP_COUNT_X_POSITION, y_position, _LARGE_ATLAS)
 
     def _draw_playtests_count(self) -> None:
         text = f"{self._data['playtests']}"
-        position = self._get_center_x_position(_MISC_DATA_WIDTH, _PLAYTEST_COUNT_X_POSITION, text, self._large_font)
-        self._draw.text(
-            (position, _MISC_DATA_Y_POSITION + (_MISC_DATA_HEIGHT // 4)),
-            text,
-            font=self._large_font,
-            fill=(255, 255, 255),
-        )
+        y_position = _MISC_DATA_Y_POSITION + (_MISC_DATA_HEIGHT // 4)
+        self._draw_label(text, _MISC_DATA_WIDTH, _PLAYTEST_COUNT_X_POSITION, y_position, _LARGE_ATLAS)
 
     def _draw_world_records_count(self) -> None:
         text = f"{self._data['world_records']}"
-        position = self._get_center_x_position(
-            _MISC_DATA_WIDTH, _WORLD_RECORDS_COUNT_X_POSITION, text, self._large_font
-        )
-        self._draw.text(
-            (position, _MISC_DATA_Y_POSITION + (_MISC_DATA_HEIGHT // 4)),
+        self._draw_label(
             text,
-            font=self._large_font,
-            fill=(255, 255, 255),
+            _MISC_DATA_WIDTH,
+            _WORLD_RECORDS_COUNT_X_POSITION,
+            _MISC_DATA_Y_POSITION + (_MISC_DATA_HEIGHT // 4),
+            _LARGE_ATLAS,
         )
 
     def _draw_name(self) -> None:
@@ -213,14 +267,100 @@ class RankCardBuilder:
                 draw_emojis=True,
             )
 
+    def _draw_label(self, text: str, width: int, initial_pos: int, y_position: int, atlas: GlyphAtlas) -> None:
+        if not atlas.supports(text):
+            position = self._get_center_x_position(width, initial_pos, text, atlas.font)
+            self._draw.text((position, y_position), text, font=atlas.font, fill=_TEXT_FILL)
+            return
+        position = (width // 2 - atlas.text_length(text) // 2) + initial_pos
+        atlas.draw(self._rank_card, (position, y_position), text, _TEXT_FILL)
+
     def _get_center_x_position(self, width: int, initial_pos: int, text: str, _font: FreeTypeFont) -> float:
         return (width // 2 - self._draw.textlength(text, _font) // 2) + initial_pos
 
 
-async def fetch_user_rank_data(
-    db: asyncpg.Connection, user_id: int, include_archived: bool, include_beginner: bool
-) -> list[RankDetail]:
-    """Fetch user rank data."""
+def negotiate_card_format(accept: str | None, requested: CARD_FORMAT_T | None = None) -> CARD_FORMAT_T:
+    """Pick the output format from an explicit request or the Accept header.
+
+    Falls back to PNG when nothing better is acceptable.
+    """
+    if requested in SUPPORTED_CARD_FORMATS:
+        return requested
+    if not accept:
+        return "png"
+
+    by_media_type = {media_type: fmt for fmt, (_, media_type, _) in _CARD_FORMATS.items()}
+    preferences = []
+    for position, part in enumerate(accept.split(",")):
+        media_type, *params = (p.strip() for p in part.split(";"))
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        preferences.append((-quality, position, media_type.lower()))
+
+    for neg_quality, _, media_type in sorted(preferences):
+        if neg_quality == 0:
+            break
+        fmt = by_media_type.get(media_type)
+        if fmt in SUPPORTED_CARD_FORMATS:
+            return fmt
+    return "png"
+
+
+def card_media_type(card_format: CARD_FORMAT_T) -> str:
+    """Get the media type for a card format."""
+    return _CARD_FORMATS[card_format][1]
+
+
+def encode_card(image: Image.Image, card_format: CARD_FORMAT_T, size: CARD_SIZE_T) -> bytes:
+    """Resample a full size card if needed and encode it."""
+    if size != "full":
+        image = image.resize(CARD_SIZES[size], Image.Resampling.LANCZOS)
+    pil_format, _, options = _CARD_FORMATS[card_format]
+    buf = io.BytesIO()
+    image.save(buf, format=pil_format, **options)
+    return buf.getvalue()
+
+
+def render_card_bytes(data: dict, card_format: CARD_FORMAT_T, size: CARD_SIZE_T) -> bytes:
+    """Render and encode a card in one call so it can run in a worker process."""
+    return encode_card(RankCardBuilder(data).create_card(), card_format, size)
+
+
+@cache
+def render_pool() -> ProcessPoolExecutor:
+    """Get the shared worker pool used for batch rendering."""
+    workers = int(os.getenv("RANK_CARD_RENDER_WORKERS", min(4, os.cpu_count() or 1)))
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+async def render_cards_in_pool(
+    cards: dict[int, dict], card_format: CARD_FORMAT_T, size: CARD_SIZE_T
+) -> AsyncGenerator[tuple[int, bytes], None]:
+    """Render cards across the worker pool, yielding each one as soon as it is finished."""
+    loop = asyncio.get_running_loop()
+    pool = render_pool()
+
+    async def _render(user_id: int, data: dict) -> tuple[int, bytes]:
+        return user_id, await loop.run_in_executor(pool, render_card_bytes, data, card_format, size)
+
+    tasks = [asyncio.ensure_future(_render(user_id, data)) for user_id, data in cards.items()]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def fetch_users_rank_data(
+    db: asyncpg.Connection, user_ids: list[int], include_archived: bool, include_beginner: bool
+) -> dict[int, list[RankDetail]]:
+    """Fetch rank data for several users at once."""
     query = """
         WITH unioned_records AS (
             (
@@ -228,14 +368,11 @@ async def fetch_user_rank_data(
                     map_code,
                     user_id,
                     record,
-                    screenshot,
                     video,
                     verified,
-                    message_id,
-                    channel_id,
-                    completion,
                     NULL AS medal
                 FROM records
+                WHERE user_id = ANY($1::bigint[])
                 ORDER BY map_code, user_id, inserted_at DESC
             )
             UNION ALL
@@ -244,14 +381,11 @@ async def fetch_user_rank_data(
                     map_code,
                     user_id,
                     record,
-                    screenshot,
                     video,
                     TRUE AS verified,
-                    message_id,
-                    channel_id,
-                    FALSE AS completion,
                     medal
                 FROM legacy_records
+                WHERE user_id = ANY($1::bigint[])
                 ORDER BY map_code, user_id, inserted_at DESC
             )
         ),
@@ -269,11 +403,8 @@ async def fetch_user_rank_data(
                     ('[9.41,10.0]'::numrange, 'Hell', NULL)
             ) AS ranges("range", "name", "includes_beginner")
             WHERE includes_beginner = $3 OR includes_beginner IS NULL
-            --($3 IS TRUE OR (includes_beginner = TRUE AND includes_beginner IS NULL))
-            -- includes_beginner = $3 OR includes_beginner IS NULL
         ),
         thresholds AS (
-            -- Mapping difficulty names to thresholds using VALUES
             SELECT * FROM (
                 VALUES
                     ('Easy', 10),
@@ -286,6 +417,7 @@ async def fetch_user_rank_data(
         ),
         map_data AS (
             SELECT DISTINCT ON (m.map_code, r.user_id)
+                r.user_id,
                 AVG(mr.difficulty) AS difficulty,
                 r.verified = TRUE AND r.video IS NOT NULL AND(
                     record <= gold OR medal LIKE 'Gold'
@@ -300,18 +432,17 @@ async def fetch_user_rank_data(
             LEFT JOIN maps m ON r.map_code = m.map_code
             LEFT JOIN map_ratings mr ON m.map_code = mr.map_code
             LEFT JOIN map_medals mm ON r.map_code = mm.map_code
-            WHERE r.user_id = $1
-              AND m.official = TRUE
+            WHERE m.official = TRUE
               AND ($2 IS TRUE OR m.archived = FALSE)
             GROUP BY m.map_code, record, gold, silver, bronze, r.verified, medal, r.user_id, r.video
         ), counts_data AS (
         SELECT
+            md.user_id,
             r.name AS difficulty,
             count(r.name) AS completions,
             count(CASE WHEN gold THEN 1 END) AS gold,
             count(CASE WHEN silver THEN 1 END) AS silver,
             count(CASE WHEN bronze THEN 1 END) AS bronze,
-            -- Use threshold for rank comparison
             count(r.name) >= t.threshold AS rank_met,
             count(CASE WHEN gold THEN 1 END) >= t.threshold AS gold_rank_met,
             count(CASE WHEN silver THEN 1 END) >= t.threshold AS silver_rank_met,
@@ -319,9 +450,10 @@ async def fetch_user_rank_data(
         FROM ranges r
         INNER JOIN map_data md ON r.range @> md.difficulty
         INNER JOIN thresholds t ON r.name = t.name
-        GROUP BY r.name, t.threshold
+        GROUP BY md.user_id, r.name, t.threshold
         )
         SELECT
+            u.user_id,
             name AS difficulty,
             coalesce(completions, 0) AS completions,
             coalesce(gold, 0) AS gold,
@@ -331,9 +463,11 @@ async def fetch_user_rank_data(
             coalesce(gold_rank_met, FALSE) AS gold_rank_met,
             coalesce(silver_rank_met, FALSE) AS silver_rank_met,
             coalesce(bronze_rank_met, FALSE) AS bronze_rank_met
-        FROM thresholds t
-        LEFT JOIN counts_data cd ON t.name = cd.difficulty
+        FROM unnest($1::bigint[]) AS u(user_id)
+        CROSS JOIN thresholds t
+        LEFT JOIN counts_data cd ON t.name = cd.difficulty AND u.user_id = cd.user_id
         ORDER BY
+        u.user_id,
         CASE name
             WHEN 'Easy' THEN 1
             WHEN 'Medium' THEN 2
@@ -343,8 +477,120 @@ async def fetch_user_rank_data(
             WHEN 'Hell' THEN 6
         END;
     """
-    rows = await db.fetch(query, user_id, include_archived, include_beginner)
-    return [RankDetail(**row) for row in rows]
+    rows = await db.fetch(query, user_ids, include_archived, include_beginner)
+    details: dict[int, list[RankDetail]] = {user_id: [] for user_id in user_ids}
+    for row in rows:
+        user_id, *values = row.values()
+        details[user_id].append(RankDetail(*values))
+    return details
+
+
+async def fetch_world_record_counts(db: asyncpg.Connection, user_ids: list[int]) -> dict[int, int]:
+    """Count the official world records held by several users."""
+    query = """
+        WITH all_records AS (
+            SELECT
+                user_id,
+                r.map_code,
+                record,
+                rank() OVER (
+                    PARTITION BY r.map_code
+                    ORDER BY record
+                ) as pos
+            FROM records r
+            LEFT JOIN maps m on r.map_code = m.map_code
+            WHERE m.official = TRUE AND record < 99999999 AND video IS NOT NULL
+        )
+        SELECT user_id, count(*) AS amount FROM all_records
+        WHERE user_id = ANY($1::bigint[]) AND pos = 1
+        GROUP BY user_id
+    """
+    return {row["user_id"]: row["amount"] for row in await db.fetch(query, user_ids)}
+
+
+async def fetch_maps_counts(db: asyncpg.Connection, user_ids: list[int]) -> dict[int, int]:
+    """Count the official maps created by several users."""
+    query = """
+        SELECT mc.user_id, count(*) AS amount
+        FROM maps
+        LEFT JOIN map_creators mc ON maps.map_code = mc.map_code
+        WHERE mc.user_id = ANY($1::bigint[]) AND official = TRUE
+        GROUP BY mc.user_id
+    """
+    return {row["user_id"]: row["amount"] for row in await db.fetch(query, user_ids)}
+
+
+async def fetch_playtests_counts(db: asyncpg.Connection, user_ids: list[int]) -> dict[int, int]:
+    """Get the playtest counts of several users."""
+    query = "SELECT user_id, amount FROM playtest_count WHERE user_id = ANY($1::bigint[])"
+    return {row["user_id"]: row["amount"] for row in await db.fetch(query, user_ids)}
+
+
+async def fetch_nicknames(db: asyncpg.Connection, user_ids: list[int]) -> dict[int, str]:
+    """Get the display names of several users, preferring their primary Overwatch username."""
+    query = """
+        SELECT u.user_id, coalesce(own.username, u.nickname) AS nickname
+        FROM users u
+        LEFT JOIN user_overwatch_usernames own ON own.user_id = u.user_id AND own.is_primary = TRUE
+        WHERE u.user_id = ANY($1::bigint[])
+    """
+    return {row["user_id"]: row["nickname"] for row in await db.fetch(query, user_ids)}
+
+
+async def fetch_rank_card_versions(db: asyncpg.Connection, user_ids: list[int]) -> dict[int, tuple[int, int]]:
+    """Get the (global, user) rank card versions for several users."""
+    query = """
+        SELECT u.user_id, g.version AS global_version, coalesce(v.version, 0) AS version
+        FROM unnest($1::bigint[]) AS u(user_id)
+        CROSS JOIN rank_card_global_version g
+        LEFT JOIN rank_card_versions v ON v.user_id = u.user_id
+    """
+    rows = await db.fetch(query, list(dict.fromkeys(user_ids)))
+    return {row["user_id"]: (row["global_version"], row["version"]) for row in rows}
+
+
+async def fetch_rank_card_data(
+    db: asyncpg.Connection, user_ids: list[int], global_version: int | None = None
+) -> dict[int, dict]:
+    """Fetch the data used by RankCardBuilder for several users with set-based queries."""
+    user_ids = list(dict.fromkeys(user_ids))
+    totals = await get_map_totals(db, include_beginner=True, version=global_version)
+    rank_data = await fetch_users_rank_data(db, user_ids, True, True)
+    world_records = await fetch_world_record_counts(db, user_ids)
+    maps = await fetch_maps_counts(db, user_ids)
+    playtests = await fetch_playtests_counts(db, user_ids)
+    nicknames = await fetch_nicknames(db, user_ids)
+
+    cards = {}
+    for user_id in user_ids:
+        data = {
+            "rank": find_highest_rank(rank_data[user_id]),
+            "name": nicknames.get(user_id),
+            "bg": 1,
+            "maps": maps.get(user_id, 0),
+            "playtests": playtests.get(user_id, 0),
+            "world_records": world_records.get(user_id, 0),
+        }
+
+        for row in rank_data[user_id]:
+            data[row.difficulty] = {
+                "completed": row.completions,
+                "gold": row.gold,
+                "silver": row.silver,
+                "bronze": row.bronze,
+            }
+
+        data["Beginner"] = {
+            "completed": 0,
+            "gold": 0,
+            "silver": 0,
+            "bronze": 0,
+        }
+
+        for name, total in totals.items():
+            data[name]["total"] = total
+        cards[user_id] = data
+    return cards
 
 
 def find_highest_rank(data: list[RankDetail]) -> str:
@@ -1,8 +1,8 @@
 import enum
 import re
-from typing import Literal
+from typing import Annotated, Literal
 
-from msgspec import Struct
+from msgspec import Meta, Struct
 
 NOTIFICATION_TYPES = Literal[
     "NONE",
@@ -78,3 +78,17 @@ class OverwatchUsernamesUpdate(Struct):
 
 class OverwatchUsernamesResponse(OverwatchUsernamesUpdate):
     user_id: int
+
+
+class NotificationsBatchBody(Struct):
+    user_ids: Annotated[list[int], Meta(min_length=1, max_length=5000)]
+
+
+class UserNotificationFlagsResponse(Struct):
+    user_id: int
+    flags: int
+
+
+class NotificationFlagUsersResponse(Struct):
+    user_ids: list[int]
+    next_after: int | None = None
@@ -4,19 +4,26 @@ import logging
 from typing import Annotated
 
 from asyncpg import Connection  # noqa: TC002
-from litestar import Request, Response, get, patch, put
+from litestar import Request, Response, get, patch, post, put
+from litestar.datastructures import State  # noqa: TC002
 from litestar.exceptions import HTTPException
-from litestar.params import Body
+from litestar.params import Body, Parameter
 from litestar.status_codes import HTTP_200_OK, HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND
 
+from utils.settings_cache import get_profile_setting, get_user_setting, invalidate_user_settings
+
+from ..rank_card.prerender import schedule_rank_card_render
 from ..root import BaseController
 from .models import (
     NOTIFICATION_TYPES,
     Notification,
+    NotificationFlagUsersResponse,
+    NotificationsBatchBody,
     OverwatchUsernameItem,
     OverwatchUsernamesResponse,
     OverwatchUsernamesUpdate,
     SettingsUpdate,
+    UserNotificationFlagsResponse,
 )
 
 logger = logging.getLogger(__name__)
@@ -53,7 +60,7 @@ class SettingsController(BaseController):
             Response: The response containing the user's settings or an error message.
 
         """
-        bitmask = await self._fetch_user_notifications(db_connection, user_id)
+        bitmask = await get_profile_setting(db_connection, user_id, "notifications")
         if bitmask is None:
             logger.debug("User %s not found.", user_id)
             bitmask = 0
@@ -63,6 +70,64 @@ class SettingsController(BaseController):
         logger.debug("User %s settings: %s", user_id, notifications)
         return Response({"user_id": user_id, "notifications": notifications}, status_code=HTTP_200_OK)
 
+    @post("/notifications/batch")
+    async def get_users_notifications(
+        self, db_connection: Connection, data: NotificationsBatchBody
+    ) -> list[UserNotificationFlagsResponse]:
+        """Retrieve the notification bitmasks for many users at once.
+
+        Args:
+            db_connection (Connection): The database connection.
+            data (NotificationsBatchBody): The user IDs to look up.
+
+        Returns:
+            list[UserNotificationFlagsResponse]: One bitmask per unique user ID in request order, 0 for unknown users.
+
+        """
+        query = """
+            SELECT u.user_id, coalesce(s.flags, 0) AS flags
+            FROM unnest($1::bigint[]) WITH ORDINALITY AS u(user_id, position)
+            LEFT JOIN user_notification_settings s ON s.user_id = u.user_id
+            ORDER BY u.position
+        """
+        rows = await db_connection.fetch(query, list(dict.fromkeys(data.user_ids)))
+        return [UserNotificationFlagsResponse(row["user_id"], row["flags"]) for row in rows]
+
+    @get("/notifications/{notification_type:str}/users")
+    async def get_notification_users(
+        self,
+        db_connection: Connection,
+        notification_type: NOTIFICATION_TYPES,
+        after: int | None = None,
+        limit: Annotated[int, Parameter(ge=1, le=5000)] = 1000,
+    ) -> NotificationFlagUsersResponse:
+        """List the users with a notification flag enabled, ordered by user ID.
+
+        Args:
+            db_connection (Connection): The database connection.
+            notification_type (NOTIFICATION_TYPES): The notification flag, e.g. "PING_ON_XP_GAIN".
+            after (int | None): Only return users with a greater user ID, pass next_after from the previous page.
+            limit (int): The maximum number of user IDs to return.
+
+        Returns:
+            NotificationFlagUsersResponse: The user IDs and the value of after for the next page, if any.
+
+        """
+        if notification_type == "NONE":
+            raise HTTPException(detail="NONE is not a notification flag.", status_code=HTTP_400_BAD_REQUEST)
+        # The bit is inlined so the planner can match the per-flag partial index.
+        bit = Notification[notification_type].value
+        query = f"""
+            SELECT user_id
+            FROM user_notification_settings
+            WHERE flags & {bit} != 0 AND ($1::bigint IS NULL OR user_id > $1::bigint)
+            ORDER BY user_id
+            LIMIT $2
+        """
+        user_ids = [row["user_id"] for row in await db_connection.fetch(query, after, limit)]
+        next_after = user_ids[-1] if len(user_ids) == limit else None
+        return NotificationFlagUsersResponse(user_ids, next_after)
+
     async def _update_user_notifications(
         self, connection: Connection, user_id: int, notifications_bitmask: int
     ) -> bool:
@@ -83,6 +148,7 @@ class SettingsController(BaseController):
             await connection.execute(query, user_id, notifications_bitmask)
         except Exception:
             return False
+        invalidate_user_settings(user_id, "notifications")
         return True
 
     @put("/users/{user_id:int}/notifications")
@@ -167,6 +233,7 @@ class SettingsController(BaseController):
     async def update_overwatch_usernames(
         self,
         db_connection: Connection,
+        state: State,
         user_id: int,
         data: Annotated[OverwatchUsernamesUpdate, Body(title="User Overwatch Usernames")],
     ) -> Response:
@@ -174,6 +241,7 @@ class SettingsController(BaseController):
 
         Args:
             db_connection (Connection): The database connection.
+            state (State): The application state.
             user_id (int): The ID of the user.
             data (OverwatchUsernamesUpdate): The OverwatchUsernamesUpdate object.
 
@@ -184,6 +252,8 @@ class SettingsController(BaseController):
         try:
             logger.info(f"Set Overwatch usernames for user {user_id}: {data.usernames}")
             await self._set_overwatch_usernames(db_connection, user_id, data.usernames)
+            invalidate_user_settings(user_id, "overwatch_usernames")
+            schedule_rank_card_render(state, user_id)
             return Response({"success": True}, status_code=HTTP_200_OK)
         except Exception as e:
             logger.error(f"Error updating Overwatch usernames for user {user_id}: {e}")
@@ -193,7 +263,7 @@ class SettingsController(BaseController):
     async def _set_overwatch_usernames(
         db: Connection, user_id: int, new_usernames: list[OverwatchUsernameItem]
     ) -> None:
-        """Set the Overwatch usernames for a specific user.
+        """Replace the Overwatch usernames for a specific user in one transaction.
 
         Args:
             db (Connection): The database connection.
@@ -201,16 +271,16 @@ class SettingsController(BaseController):
             new_usernames (list[OverwatchUsernameItem]): The list of new Overwatch usernames.
 
         """
-        await db.execute("DELETE FROM user_overwatch_usernames WHERE user_id = $1", user_id)
-
-        for item in new_usernames:
+        async with db.transaction():
+            await db.execute("DELETE FROM user_overwatch_usernames WHERE user_id = $1", user_id)
             await db.execute(
                 """
-                INSERT INTO user_overwatch_usernames (user_id, username, is_primary) VALUES ($1, $2, $3)
+                INSERT INTO user_overwatch_usernames (user_id, username, is_primary)
+                SELECT $1, * FROM unnest($2::text[], $3::bool[])
                 """,
                 user_id,
-                item.username,
-                item.is_primary,
+                [item.username for item in new_usernames],
+                [item.is_primary for item in new_usernames],
             )
 
     @get("/users/{user_id:int}/overwatch")
@@ -225,7 +295,9 @@ class SettingsController(BaseController):
             Response: The response containing the user's Overwatch usernames or an error message.
 
         """
-        usernames = await self._fetch_overwatch_usernames(db_connection, user_id)
+        usernames = await get_user_setting(
+            user_id, "overwatch_usernames", lambda: self._fetch_overwatch_usernames(db_connection, user_id)
+        )
         if usernames is None:
             logger.debug(f"User {user_id} not found.")
             raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="User not found", extra={"user_id": user_id})
@@ -0,0 +1,83 @@
+-- Per-user, per-map_name mastery counts.
+-- A user's mastery amount for a map name is the number of distinct map codes with that name they have a record on.
+
+CREATE TABLE IF NOT EXISTS map_mastery_counts (
+    user_id bigint NOT NULL,
+    map_name text NOT NULL,
+    amount int NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, map_name)
+);
+
+CREATE OR REPLACE FUNCTION refresh_map_mastery_name_count(_user_id bigint, _map_name text) RETURNS void AS $$
+BEGIN
+    -- Lock the counter row before counting so concurrent refreshes for the same user and map name run one after
+    -- another, and each count sees the records committed by the one before it.
+    INSERT INTO map_mastery_counts (user_id, map_name) VALUES (_user_id, _map_name)
+    ON CONFLICT (user_id, map_name) DO NOTHING;
+    PERFORM 1 FROM map_mastery_counts WHERE user_id = _user_id AND map_name = _map_name FOR UPDATE;
+
+    UPDATE map_mastery_counts
+    SET amount = (
+        SELECT count(DISTINCT r.map_code)
+        FROM records r
+        JOIN maps m ON r.map_code = m.map_code
+        WHERE r.user_id = _user_id AND m.map_name::text = _map_name
+    )
+    WHERE user_id = _user_id AND map_name = _map_name;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION refresh_map_mastery_count(_user_id bigint, _map_code text) RETURNS void AS $$
+DECLARE
+    _map_name text;
+BEGIN
+    SELECT map_name::text INTO _map_name FROM maps WHERE map_code = _map_code;
+    IF _map_name IS NOT NULL THEN
+        PERFORM refresh_map_mastery_name_count(_user_id, _map_name);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION map_mastery_counts_on_records_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM refresh_map_mastery_count(OLD.user_id, OLD.map_code);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM refresh_map_mastery_count(NEW.user_id, NEW.map_code);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS map_mastery_counts_records_trigger ON records;
+CREATE TRIGGER map_mastery_counts_records_trigger
+    AFTER INSERT OR DELETE OR UPDATE OF user_id, map_code ON records
+    FOR EACH ROW EXECUTE FUNCTION map_mastery_counts_on_records_change();
+
+-- Renaming a map or changing its code moves its records to another map name for every user with a record on it.
+CREATE OR REPLACE FUNCTION map_mastery_counts_on_maps_change() RETURNS trigger AS $$
+BEGIN
+    PERFORM refresh_map_mastery_name_count(r.user_id, n.map_name)
+    FROM (SELECT DISTINCT user_id FROM records WHERE map_code IN (OLD.map_code, NEW.map_code)) r
+    CROSS JOIN (SELECT DISTINCT map_name FROM (VALUES (OLD.map_name::text), (NEW.map_name::text)) v(map_name)) n
+    WHERE n.map_name IS NOT NULL;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS map_mastery_counts_maps_trigger ON maps;
+CREATE TRIGGER map_mastery_counts_maps_trigger
+    AFTER UPDATE OF map_name, map_code ON maps
+    FOR EACH ROW
+    WHEN ((OLD.map_name, OLD.map_code) IS DISTINCT FROM (NEW.map_name, NEW.map_code))
+    EXECUTE FUNCTION map_mastery_counts_on_maps_change();
+
+CREATE INDEX IF NOT EXISTS records_user_id_map_code_idx ON records (user_id, map_code);
+
+INSERT INTO map_mastery_counts (user_id, map_name, amount)
+SELECT r.user_id, m.map_name, count(DISTINCT r.map_code)
+FROM records r
+JOIN maps m ON r.map_code = m.map_code
+GROUP BY r.user_id, m.map_name
+ON CONFLICT (user_id, map_name) DO UPDATE SET amount = EXCLUDED.amount;
@@ -0,0 +1,49 @@
+-- Per-user, per-key_type key balances kept alongside the lootbox_user_keys ledger.
+-- Balances are only written by the triggers below: inserting a ledger row increments the balance and deleting one
+-- decrements it, so the ledger stays the single source of truth. Spending locks the balance row, checks it and then
+-- deletes the oldest ledger rows. The CHECK rejects any delete that would go below zero.
+-- scripts/verify_key_balances.py compares both.
+
+CREATE TABLE IF NOT EXISTS lootbox_user_key_balances (
+    user_id bigint NOT NULL,
+    key_type text NOT NULL,
+    balance int NOT NULL DEFAULT 0 CHECK (balance >= 0),
+    PRIMARY KEY (user_id, key_type)
+);
+
+CREATE OR REPLACE FUNCTION lootbox_user_key_balances_on_key_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO lootbox_user_key_balances (user_id, key_type, balance)
+    VALUES (NEW.user_id, NEW.key_type, 1)
+    ON CONFLICT (user_id, key_type) DO UPDATE SET balance = lootbox_user_key_balances.balance + 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS lootbox_user_key_balances_trigger ON lootbox_user_keys;
+CREATE TRIGGER lootbox_user_key_balances_trigger
+    AFTER INSERT ON lootbox_user_keys
+    FOR EACH ROW EXECUTE FUNCTION lootbox_user_key_balances_on_key_insert();
+
+CREATE OR REPLACE FUNCTION lootbox_user_key_balances_on_key_delete() RETURNS trigger AS $$
+BEGIN
+    UPDATE lootbox_user_key_balances
+    SET balance = balance - 1
+    WHERE user_id = OLD.user_id AND key_type = OLD.key_type;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS lootbox_user_key_balances_delete_trigger ON lootbox_user_keys;
+CREATE TRIGGER lootbox_user_key_balances_delete_trigger
+    AFTER DELETE ON lootbox_user_keys
+    FOR EACH ROW EXECUTE FUNCTION lootbox_user_key_balances_on_key_delete();
+
+CREATE INDEX IF NOT EXISTS lootbox_user_keys_user_id_key_type_earned_at_idx
+    ON lootbox_user_keys (user_id, key_type, earned_at);
+
+INSERT INTO lootbox_user_key_balances (user_id, key_type, balance)
+SELECT user_id, key_type, count(*)
+FROM lootbox_user_keys
+GROUP BY user_id, key_type
+ON CONFLICT (user_id, key_type) DO UPDATE SET balance = EXCLUDED.balance;
@@ -0,0 +1,36 @@
+-- Per-user inventory version, bumped whenever a user's lootbox rewards or map mastery change.
+-- The paged inventory endpoint serves it as an ETag so clients can revalidate without downloading the inventory.
+
+CREATE TABLE IF NOT EXISTS lootbox_user_inventory_versions (
+    user_id bigint PRIMARY KEY,
+    version bigint NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION bump_lootbox_user_inventory_version() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO lootbox_user_inventory_versions (user_id, version) VALUES (OLD.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = lootbox_user_inventory_versions.version + 1;
+    END IF;
+    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.user_id != OLD.user_id) THEN
+        INSERT INTO lootbox_user_inventory_versions (user_id, version) VALUES (NEW.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = lootbox_user_inventory_versions.version + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS lootbox_user_inventory_rewards_trigger ON lootbox_user_rewards;
+CREATE TRIGGER lootbox_user_inventory_rewards_trigger
+    AFTER INSERT OR UPDATE OR DELETE ON lootbox_user_rewards
+    FOR EACH ROW EXECUTE FUNCTION bump_lootbox_user_inventory_version();
+
+DROP TRIGGER IF EXISTS lootbox_user_inventory_mastery_trigger ON map_mastery;
+CREATE TRIGGER lootbox_user_inventory_mastery_trigger
+    AFTER INSERT OR UPDATE OR DELETE ON map_mastery
+    FOR EACH ROW EXECUTE FUNCTION bump_lootbox_user_inventory_version();
+
+-- Match the inventory sort keys so each page is an index range scan.
+CREATE INDEX IF NOT EXISTS lootbox_user_rewards_inventory_idx
+    ON lootbox_user_rewards (user_id, reward_type, reward_name, key_type, earned_at);
+CREATE INDEX IF NOT EXISTS map_mastery_user_id_map_name_idx ON map_mastery (user_id, map_name);
@@ -0,0 +1,20 @@
+-- One partial index per notification flag, for listing the users who have that flag enabled.
+-- Queries must inline the bit as a literal (flags & 32 != 0) for the planner to match these predicates.
+-- Bit values follow controllers/settings/models.py Notification; add an index here when a flag is added.
+
+CREATE INDEX IF NOT EXISTS user_notification_settings_dm_on_verification_idx
+    ON user_notification_settings (user_id) WHERE flags & 1 != 0;
+CREATE INDEX IF NOT EXISTS user_notification_settings_dm_on_skill_role_update_idx
+    ON user_notification_settings (user_id) WHERE flags & 2 != 0;
+CREATE INDEX IF NOT EXISTS user_notification_settings_dm_on_lootbox_gain_idx
+    ON user_notification_settings (user_id) WHERE flags & 4 != 0;
+CREATE INDEX IF NOT EXISTS user_notification_settings_dm_on_records_removal_idx
+    ON user_notification_settings (user_id) WHERE flags & 8 != 0;
+CREATE INDEX IF NOT EXISTS user_notification_settings_dm_on_playtest_alerts_idx
+    ON user_notification_settings (user_id) WHERE flags & 16 != 0;
+CREATE INDEX IF NOT EXISTS user_notification_settings_ping_on_xp_gain_idx
+    ON user_notification_settings (user_id) WHERE flags & 32 != 0;
+CREATE INDEX IF NOT EXISTS user_notification_settings_ping_on_mastery_idx
+    ON user_notification_settings (user_id) WHERE flags & 64 != 0;
+CREATE INDEX IF NOT EXISTS user_notification_settings_ping_on_community_rank_update_idx
+    ON user_notification_settings (user_id) WHERE flags & 128 != 0;
@@ -0,0 +1,35 @@
+-- Deduplicate newsfeed entries when they are written instead of on every read.
+-- content_hash identifies an entry by (type, timestamp, data). Inserts that match an existing entry are skipped.
+-- Run scripts/dedupe_newsfeed.py after this migration. It backfills hashes for existing rows, removes duplicates
+-- and builds the unique index on content_hash.
+
+ALTER TABLE newsfeed ADD COLUMN IF NOT EXISTS content_hash uuid;
+-- Backs the duplicate check until the unique index is built, the script drops it afterwards.
+CREATE INDEX IF NOT EXISTS newsfeed_content_hash_idx ON newsfeed (content_hash);
+
+-- The timestamp is taken as anyelement so it hashes in the column's own type, without a time zone conversion.
+CREATE OR REPLACE FUNCTION newsfeed_content_hash(_type text, _timestamp anyelement, _data jsonb) RETURNS uuid AS $$
+    SELECT md5(_type || '|' || _timestamp::text || '|' || _data::text)::uuid;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION newsfeed_skip_duplicates() RETURNS trigger AS $$
+BEGIN
+    NEW.content_hash := newsfeed_content_hash(NEW.type, NEW.timestamp, NEW.data::jsonb);
+    -- Serialize inserts of the same entry so a concurrent copy waits for this one and is then skipped, instead of
+    -- both passing the check or the second failing on the unique index.
+    PERFORM pg_advisory_xact_lock(hashtext(NEW.content_hash::text));
+    IF EXISTS (SELECT 1 FROM newsfeed WHERE content_hash = NEW.content_hash) THEN
+        RETURN NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS newsfeed_skip_duplicates_trigger ON newsfeed;
+CREATE TRIGGER newsfeed_skip_duplicates_trigger
+    BEFORE INSERT ON newsfeed
+    FOR EACH ROW EXECUTE FUNCTION newsfeed_skip_duplicates();
+
+-- get_newsfeed reads pages in timestamp order, filtered by type or not at all.
+CREATE INDEX IF NOT EXISTS newsfeed_type_timestamp_idx ON newsfeed (type, timestamp DESC);
+CREATE INDEX IF NOT EXISTS newsfeed_timestamp_idx ON newsfeed (timestamp DESC);
@@ -0,0 +1,14 @@
+-- Publish new newsfeed entries on the "newsfeed" channel for the streaming endpoint.
+-- The payload is the entry's content_hash (see 005), which NewsfeedHub uses to load the entry.
+
+CREATE OR REPLACE FUNCTION newsfeed_notify() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('newsfeed', NEW.content_hash::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS newsfeed_notify_trigger ON newsfeed;
+CREATE TRIGGER newsfeed_notify_trigger
+    AFTER INSERT ON newsfeed
+    FOR EACH ROW EXECUTE FUNCTION newsfeed_notify();
@@ -0,0 +1,34 @@
+-- Entries older than the hot horizon, moved out of newsfeed by scripts/compact_newsfeed.py.
+-- get_newsfeed reads the archive only for pages that reach past the end of the hot table.
+
+CREATE TABLE IF NOT EXISTS newsfeed_archive (LIKE newsfeed INCLUDING DEFAULTS);
+
+CREATE INDEX IF NOT EXISTS newsfeed_archive_type_timestamp_idx ON newsfeed_archive (type, timestamp DESC);
+CREATE INDEX IF NOT EXISTS newsfeed_archive_timestamp_idx ON newsfeed_archive (timestamp DESC);
+CREATE INDEX IF NOT EXISTS newsfeed_archive_content_hash_idx ON newsfeed_archive (content_hash);
+
+-- Archived entries per type, updated by the compaction script in the same statement that moves them.
+-- get_newsfeed reads these instead of counting the archive.
+CREATE TABLE IF NOT EXISTS newsfeed_archive_counts (
+    type text PRIMARY KEY,
+    total bigint NOT NULL DEFAULT 0
+);
+
+INSERT INTO newsfeed_archive_counts (type, total)
+SELECT type, count(*) FROM newsfeed_archive GROUP BY type
+ON CONFLICT (type) DO UPDATE SET total = EXCLUDED.total;
+
+-- Keep rejecting duplicates of entries that have already been archived.
+CREATE OR REPLACE FUNCTION newsfeed_skip_duplicates() RETURNS trigger AS $$
+BEGIN
+    NEW.content_hash := newsfeed_content_hash(NEW.type, NEW.timestamp, NEW.data::jsonb);
+    -- Serialize inserts of the same entry so a concurrent copy waits for this one and is then skipped, instead of
+    -- both passing the check or the second failing on the unique index.
+    PERFORM pg_advisory_xact_lock(hashtext(NEW.content_hash::text));
+    IF EXISTS (SELECT 1 FROM newsfeed WHERE content_hash = NEW.content_hash)
+        OR EXISTS (SELECT 1 FROM newsfeed_archive WHERE content_hash = NEW.content_hash) THEN
+        RETURN NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
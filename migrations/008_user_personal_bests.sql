@@ -0,0 +1,181 @@
+-- Per-user personal bests, one row per map with the fastest time, its medal, the map's difficulty band and whether
+-- the time is the map's world record. Kept up to date by triggers on records, map_ratings and map_medals, so the
+-- personal records endpoint reads it in index order instead of aggregating every record and rating.
+
+-- Created from records so time keeps the type of records.record.
+CREATE TABLE IF NOT EXISTS user_personal_bests AS
+SELECT
+    user_id,
+    map_code,
+    record AS time,
+    NULL::text AS medal,
+    NULL::smallint AS difficulty_rank,
+    false AS is_world_record
+FROM records
+WITH NO DATA;
+
+CREATE UNIQUE INDEX IF NOT EXISTS user_personal_bests_user_id_map_code_key ON user_personal_bests (user_id, map_code);
+-- Page order of the personal records endpoint.
+CREATE INDEX IF NOT EXISTS user_personal_bests_user_id_difficulty_rank_map_code_idx
+    ON user_personal_bests (user_id, difficulty_rank, map_code);
+CREATE INDEX IF NOT EXISTS user_personal_bests_map_code_idx ON user_personal_bests (map_code);
+CREATE INDEX IF NOT EXISTS records_map_code_record_idx ON records (map_code, record);
+
+-- 1 Easy, 2 Medium, 3 Hard, 4 Very Hard, 5 Extreme, 6 Hell. NULL for maps without ratings.
+CREATE OR REPLACE FUNCTION personal_best_difficulty_rank(_difficulty numeric) RETURNS smallint AS $$
+    SELECT CASE
+        WHEN _difficulty IS NULL OR _difficulty < 0 OR _difficulty > 10 THEN NULL
+        WHEN _difficulty < 2.35 THEN 1
+        WHEN _difficulty < 4.12 THEN 2
+        WHEN _difficulty < 5.88 THEN 3
+        WHEN _difficulty < 7.65 THEN 4
+        WHEN _difficulty < 9.41 THEN 5
+        ELSE 6
+    END::smallint;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION personal_best_difficulty_name(_rank smallint) RETURNS text AS $$
+    SELECT (ARRAY['Easy', 'Medium', 'Hard', 'Very Hard', 'Extreme', 'Hell'])[_rank];
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION refresh_user_personal_best(_user_id bigint, _map_code text) RETURNS void AS $$
+BEGIN
+    -- Serialize refreshes per map. Each statement below then sees the records committed by the previous refresh,
+    -- so concurrent inserts cannot leave two world records flagged, or none.
+    PERFORM pg_advisory_xact_lock(hashtext('user_personal_bests'), hashtext(_map_code));
+
+    IF NOT EXISTS (SELECT 1 FROM records WHERE user_id = _user_id AND map_code = _map_code) THEN
+        DELETE FROM user_personal_bests WHERE user_id = _user_id AND map_code = _map_code;
+    ELSE
+        INSERT INTO user_personal_bests (user_id, map_code, time, medal, difficulty_rank, is_world_record)
+        SELECT
+            _user_id,
+            _map_code,
+            pb.time,
+            CASE
+                WHEN pb.time < mm.gold THEN 'Gold'
+                WHEN pb.time < mm.silver AND pb.time >= mm.gold THEN 'Silver'
+                WHEN pb.time < mm.bronze AND pb.time >= mm.silver THEN 'Bronze'
+            END,
+            personal_best_difficulty_rank(
+                (SELECT avg(difficulty)::numeric FROM map_ratings WHERE map_code = _map_code)
+            ),
+            false
+        FROM (SELECT min(record) AS time FROM records WHERE user_id = _user_id AND map_code = _map_code) pb
+        LEFT JOIN map_medals mm ON mm.map_code = _map_code
+        ON CONFLICT (user_id, map_code) DO UPDATE SET
+            time = EXCLUDED.time,
+            medal = EXCLUDED.medal,
+            difficulty_rank = EXCLUDED.difficulty_rank;
+    END IF;
+
+    -- A new or removed time can move the map's world record, so only rows whose flag changes are written.
+    UPDATE user_personal_bests upb
+    SET is_world_record = upb.time = wr.time
+    FROM (SELECT min(record) AS time FROM records WHERE map_code = _map_code) wr
+    WHERE upb.map_code = _map_code AND upb.is_world_record IS DISTINCT FROM (upb.time = wr.time);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION refresh_personal_best_difficulty(_map_code text) RETURNS void AS $$
+    UPDATE user_personal_bests upb
+    SET difficulty_rank = d.rank
+    FROM (
+        SELECT personal_best_difficulty_rank(
+            (SELECT avg(difficulty)::numeric FROM map_ratings WHERE map_code = _map_code)
+        ) AS rank
+    ) d
+    WHERE upb.map_code = _map_code AND upb.difficulty_rank IS DISTINCT FROM d.rank;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION refresh_personal_best_medals(_map_code text) RETURNS void AS $$
+    UPDATE user_personal_bests upb
+    SET medal = m.medal
+    FROM (
+        SELECT
+            upb2.user_id,
+            CASE
+                WHEN upb2.time < mm.gold THEN 'Gold'
+                WHEN upb2.time < mm.silver AND upb2.time >= mm.gold THEN 'Silver'
+                WHEN upb2.time < mm.bronze AND upb2.time >= mm.silver THEN 'Bronze'
+            END AS medal
+        FROM user_personal_bests upb2
+        LEFT JOIN map_medals mm ON mm.map_code = _map_code
+        WHERE upb2.map_code = _map_code
+    ) m
+    WHERE upb.map_code = _map_code AND upb.user_id = m.user_id AND upb.medal IS DISTINCT FROM m.medal;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION user_personal_bests_on_records_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM refresh_user_personal_best(OLD.user_id, OLD.map_code);
+    END IF;
+    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND (NEW.user_id, NEW.map_code) IS DISTINCT FROM (OLD.user_id, OLD.map_code)) THEN
+        PERFORM refresh_user_personal_best(NEW.user_id, NEW.map_code);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION user_personal_bests_on_map_ratings_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM refresh_personal_best_difficulty(OLD.map_code);
+    END IF;
+    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.map_code != OLD.map_code) THEN
+        PERFORM refresh_personal_best_difficulty(NEW.map_code);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION user_personal_bests_on_map_medals_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM refresh_personal_best_medals(OLD.map_code);
+    END IF;
+    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.map_code != OLD.map_code) THEN
+        PERFORM refresh_personal_best_medals(NEW.map_code);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS user_personal_bests_records_trigger ON records;
+CREATE TRIGGER user_personal_bests_records_trigger
+    AFTER INSERT OR DELETE OR UPDATE OF user_id, map_code, record ON records
+    FOR EACH ROW EXECUTE FUNCTION user_personal_bests_on_records_change();
+
+DROP TRIGGER IF EXISTS user_personal_bests_map_ratings_trigger ON map_ratings;
+CREATE TRIGGER user_personal_bests_map_ratings_trigger
+    AFTER INSERT OR DELETE OR UPDATE OF map_code, difficulty ON map_ratings
+    FOR EACH ROW EXECUTE FUNCTION user_personal_bests_on_map_ratings_change();
+
+DROP TRIGGER IF EXISTS user_personal_bests_map_medals_trigger ON map_medals;
+CREATE TRIGGER user_personal_bests_map_medals_trigger
+    AFTER INSERT OR DELETE OR UPDATE ON map_medals
+    FOR EACH ROW EXECUTE FUNCTION user_personal_bests_on_map_medals_change();
+
+INSERT INTO user_personal_bests (user_id, map_code, time, medal, difficulty_rank, is_world_record)
+SELECT
+    pb.user_id,
+    pb.map_code,
+    pb.time,
+    CASE
+        WHEN pb.time < mm.gold THEN 'Gold'
+        WHEN pb.time < mm.silver AND pb.time >= mm.gold THEN 'Silver'
+        WHEN pb.time < mm.bronze AND pb.time >= mm.silver THEN 'Bronze'
+    END,
+    personal_best_difficulty_rank(d.difficulty),
+    pb.time = wr.time
+FROM (SELECT user_id, map_code, min(record) AS time FROM records GROUP BY user_id, map_code) pb
+JOIN (SELECT map_code, min(record) AS time FROM records GROUP BY map_code) wr ON wr.map_code = pb.map_code
+LEFT JOIN (SELECT map_code, avg(difficulty)::numeric AS difficulty FROM map_ratings GROUP BY map_code) d
+    ON d.map_code = pb.map_code
+LEFT JOIN map_medals mm ON mm.map_code = pb.map_code
+ON CONFLICT (user_id, map_code) DO UPDATE SET
+    time = EXCLUDED.time,
+    medal = EXCLUDED.medal,
+    difficulty_rank = EXCLUDED.difficulty_rank,
+    is_world_record = EXCLUDED.is_world_record;
@@ -0,0 +1,122 @@
+-- Versions of the data drawn on rank cards, so a cached card is checked with one lookup instead of its queries.
+-- rank_card_versions is bumped per user when their records, created maps, playtests or names change, or when a
+-- record change moves the world record on a map they hold or held it on. rank_card_global_version is bumped when
+-- maps, ratings or medals change, which moves every card's totals and difficulties.
+-- Per-user bumps also NOTIFY rank_card with the user_id so the API pre-renders cards it has cached.
+
+CREATE TABLE IF NOT EXISTS rank_card_versions (
+    user_id bigint PRIMARY KEY,
+    version bigint NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS rank_card_global_version (
+    id boolean PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version bigint NOT NULL DEFAULT 0
+);
+INSERT INTO rank_card_global_version (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_rank_card_version(_user_id bigint) RETURNS void AS $$
+BEGIN
+    INSERT INTO rank_card_versions (user_id, version) VALUES (_user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = rank_card_versions.version + 1;
+    PERFORM pg_notify('rank_card', _user_id::text);
+END;
+$$ LANGUAGE plpgsql;
+
+-- A record change can only move the world record between the holders of the two lowest qualifying times.
+CREATE OR REPLACE FUNCTION bump_rank_card_world_record_holders(_map_code text) RETURNS void AS $$
+BEGIN
+    PERFORM bump_rank_card_version(holders.user_id)
+    FROM (
+        SELECT DISTINCT r.user_id
+        FROM records r
+        WHERE r.map_code = _map_code AND r.record < 99999999 AND r.video IS NOT NULL AND r.record IN (
+            SELECT DISTINCT record
+            FROM records
+            WHERE map_code = _map_code AND record < 99999999 AND video IS NOT NULL
+            ORDER BY record
+            LIMIT 2
+        )
+    ) holders;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rank_card_versions_on_records_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_rank_card_version(OLD.user_id);
+        PERFORM bump_rank_card_world_record_holders(OLD.map_code);
+    END IF;
+    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND (NEW.user_id, NEW.map_code) IS DISTINCT FROM (OLD.user_id, OLD.map_code)) THEN
+        PERFORM bump_rank_card_version(NEW.user_id);
+        PERFORM bump_rank_card_world_record_holders(NEW.map_code);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rank_card_versions_on_user_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_rank_card_version(OLD.user_id);
+    END IF;
+    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.user_id != OLD.user_id) THEN
+        PERFORM bump_rank_card_version(NEW.user_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rank_card_global_version_on_change() RETURNS trigger AS $$
+BEGIN
+    UPDATE rank_card_global_version SET version = version + 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS rank_card_versions_records_trigger ON records;
+CREATE TRIGGER rank_card_versions_records_trigger
+    AFTER INSERT OR DELETE OR UPDATE ON records
+    FOR EACH ROW EXECUTE FUNCTION rank_card_versions_on_records_change();
+
+DROP TRIGGER IF EXISTS rank_card_versions_users_trigger ON users;
+CREATE TRIGGER rank_card_versions_users_trigger
+    AFTER UPDATE OF nickname ON users
+    FOR EACH ROW EXECUTE FUNCTION rank_card_versions_on_user_change();
+
+DROP TRIGGER IF EXISTS rank_card_versions_overwatch_usernames_trigger ON user_overwatch_usernames;
+CREATE TRIGGER rank_card_versions_overwatch_usernames_trigger
+    AFTER INSERT OR DELETE OR UPDATE ON user_overwatch_usernames
+    FOR EACH ROW EXECUTE FUNCTION rank_card_versions_on_user_change();
+
+DROP TRIGGER IF EXISTS rank_card_versions_map_creators_trigger ON map_creators;
+CREATE TRIGGER rank_card_versions_map_creators_trigger
+    AFTER INSERT OR DELETE OR UPDATE ON map_creators
+    FOR EACH ROW EXECUTE FUNCTION rank_card_versions_on_user_change();
+
+-- playtest_count is only given a trigger when it is a plain table.
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('playtest_count')) = 'r' THEN
+        DROP TRIGGER IF EXISTS rank_card_versions_playtest_count_trigger ON playtest_count;
+        CREATE TRIGGER rank_card_versions_playtest_count_trigger
+            AFTER INSERT OR DELETE OR UPDATE ON playtest_count
+            FOR EACH ROW EXECUTE FUNCTION rank_card_versions_on_user_change();
+    END IF;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS rank_card_global_version_maps_trigger ON maps;
+CREATE TRIGGER rank_card_global_version_maps_trigger
+    AFTER INSERT OR DELETE OR UPDATE ON maps
+    FOR EACH STATEMENT EXECUTE FUNCTION rank_card_global_version_on_change();
+
+DROP TRIGGER IF EXISTS rank_card_global_version_map_ratings_trigger ON map_ratings;
+CREATE TRIGGER rank_card_global_version_map_ratings_trigger
+    AFTER INSERT OR DELETE OR UPDATE ON map_ratings
+    FOR EACH STATEMENT EXECUTE FUNCTION rank_card_global_version_on_change();
+
+DROP TRIGGER IF EXISTS rank_card_global_version_map_medals_trigger ON map_medals;
+CREATE TRIGGER rank_card_global_version_map_medals_trigger
+    AFTER INSERT OR DELETE OR UPDATE ON map_medals
+    FOR EACH STATEMENT EXECUTE FUNCTION rank_card_global_version_on_change();
@@ -0,0 +1,188 @@
+"""Benchmark RankCardBuilder against synthetic data using only the bundled assets.
+
+Usage:
+    python scripts/benchmark_rank_card.py --iterations 20 --workers 4
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+# Asset paths used by the builder are relative to the repository root.
+os.chdir(ROOT)
+
+from controllers.rank_card.utils import (  # noqa: E402
+    RANKS,
+    SUPPORTED_CARD_FORMATS,
+    RankCardBuilder,
+    encode_card,
+    render_card_bytes,
+)
+
+DIFFICULTIES = ("Beginner", "Easy", "Medium", "Hard", "Very Hard", "Extreme", "Hell")
+
+NICKNAMES = (
+    "nebula",
+    "忍者は壁を登り続ける忍者は壁を登り続ける",
+    "닌자점프마스터닌자점프마스터",
+    "🥷🔥💯✨🎮🥷🔥💯✨🎮",
+    "Genji 忍者 🥷 mixed nickname that keeps going",
+)
+
+COUNT_PROFILES = {
+    "empty": (0, 0, 250),
+    "partial": (37, 12, 250),
+    "complete": (250, 250, 250),
+    "extreme": (99999, 99999, 99999),
+}
+
+STAGES = {
+    "_add_layer1": "layer paste",
+    "_add_layer2": "layer paste",
+    "_add_rank_emblem": "layer paste",
+    "_create_completion_bar": "bars",
+    "_add_completion_labels": "labels",
+    "_add_completion_medals": "labels",
+    "_draw_maps_count": "labels",
+    "_draw_playtests_count": "labels",
+    "_draw_world_records_count": "labels",
+    "_draw_name": "nickname",
+}
+
+
+def synthetic_cards() -> list[dict]:
+    """Build card data covering every background, rank, nickname style and count profile."""
+    backgrounds = sorted(int(p.stem) for p in (ROOT / "assets" / "layer0").glob("*.png"))
+    cards = []
+    combinations = zip(
+        itertools.cycle(backgrounds),
+        itertools.cycle(RANKS),
+        itertools.cycle(NICKNAMES),
+        itertools.cycle(COUNT_PROFILES.values()),
+    )
+    for bg, rank, nickname, (completed, medals, total) in itertools.islice(
+        combinations, max(len(backgrounds), len(RANKS), len(NICKNAMES), len(COUNT_PROFILES))
+    ):
+        data = {
+            "rank": rank,
+            "name": nickname,
+            "bg": bg,
+            "maps": completed,
+            "playtests": medals,
+            "world_records": medals,
+        }
+        for difficulty in DIFFICULTIES:
+            data[difficulty] = {
+                "completed": completed,
+                "gold": medals,
+                "silver": medals,
+                "bronze": medals,
+                "total": total,
+            }
+        cards.append(data)
+    return cards
+
+
+class TimedRankCardBuilder(RankCardBuilder):
+    """RankCardBuilder that records exclusive time spent in each drawing stage."""
+
+    def __init__(self, data: dict, timings: dict[str, list[float]]) -> None:
+        start = time.perf_counter()
+        super().__init__(data)
+        timings["layer paste"].append(time.perf_counter() - start)
+        self._timings = timings
+        self._stack: list[float] = []
+        for method_name, stage in STAGES.items():
+            setattr(self, method_name, self._timed(stage, getattr(self, method_name)))
+
+    def _timed(self, stage: str, method):  # noqa: ANN001, ANN202
+        def wrapper(*args, **kwargs):  # noqa: ANN002, ANN003, ANN202
+            self._stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                nested = self._stack.pop()
+                self._timings[stage].append(elapsed - nested)
+                if self._stack:
+                    self._stack[-1] += elapsed
+
+        return wrapper
+
+
+def measure_stages(cards: list[dict], iterations: int) -> None:
+    """Print per stage timings for rendering and encoding."""
+    timings: dict[str, list[float]] = defaultdict(list)
+    per_card: list[float] = []
+    for _ in range(iterations):
+        for data in cards:
+            card_timings: dict[str, list[float]] = defaultdict(list)
+            start = time.perf_counter()
+            image = TimedRankCardBuilder(data, card_timings).create_card()
+            per_card.append(time.perf_counter() - start)
+            for stage, values in card_timings.items():
+                timings[stage].append(sum(values))
+            for card_format in SUPPORTED_CARD_FORMATS:
+                for size in ("full", "small"):
+                    start = time.perf_counter()
+                    encode_card(image, card_format, size)
+                    timings[f"encode {card_format} {size}"].append(time.perf_counter() - start)
+
+    print(f"{'stage':<24}{'mean ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for stage, values in [*timings.items(), ("render total", per_card)]:
+        ordered = sorted(values)
+        p95 = ordered[int(len(ordered) * 0.95) - 1] if len(ordered) > 1 else ordered[0]
+        print(f"{stage:<24}{statistics.fmean(ordered) * 1000:>10.2f}{p95 * 1000:>10.2f}{ordered[-1] * 1000:>10.2f}")
+
+
+def measure_throughput(cards: list[dict], iterations: int, executor: Executor, label: str) -> None:
+    """Print cards per second for rendering and encoding PNGs on an executor."""
+    jobs = cards * iterations
+    # Warm up workers so process start up and font loading are not measured.
+    list(executor.map(render_card_bytes, cards[:1], ["png"], ["full"]))
+    start = time.perf_counter()
+    list(executor.map(render_card_bytes, jobs, ["png"] * len(jobs), ["full"] * len(jobs)))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24}{len(jobs) / elapsed:>10.1f} cards/s")
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=5, help="Times each synthetic card is rendered.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Parallel workers to test.")
+    args = parser.parse_args()
+
+    cards = synthetic_cards()
+    print(f"{len(cards)} synthetic cards, {args.iterations} iterations, formats: {', '.join(SUPPORTED_CARD_FORMATS)}\n")
+    measure_stages(cards, args.iterations)
+
+    print()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        measure_throughput(cards, args.iterations, executor, "serial")
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        measure_throughput(cards, args.iterations, executor, f"threads x{args.workers}")
+    # Forked workers can inherit locked font state from imagetext_py, so match the production pool and spawn.
+    spawn = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=spawn) as executor:
+        measure_throughput(cards, args.iterations, executor, f"processes x{args.workers}")
+
+    # ru_maxrss is reported in kilobytes on Linux.
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(f"\npeak RSS: {self_rss:.1f} MiB (main), {children_rss:.1f} MiB (largest worker)")
+
+
+if __name__ == "__main__":
+    main()
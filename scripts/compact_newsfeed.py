@@ -0,0 +1,81 @@
+"""Move newsfeed entries older than the hot horizon into newsfeed_archive.
+
+Entries are moved oldest first in batches, each batch in its own transaction, so the job can be stopped and rerun.
+Each batch also adds to newsfeed_archive_counts, which get_newsfeed reads for total_results.
+The horizon defaults to NEWSFEED_HOT_DAYS (90 days). Meant to run on a schedule, e.g. daily from cron.
+
+Usage:
+    python scripts/compact_newsfeed.py [--dsn postgresql://...] [--horizon-days 90] [--batch-size 5000]
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+
+import asyncpg
+
+MOVE_QUERY = """
+    WITH moved AS (
+        DELETE FROM newsfeed
+        WHERE ctid = ANY(ARRAY(
+            SELECT ctid FROM newsfeed
+            WHERE timestamp < $1::timestamptz
+            ORDER BY timestamp
+            LIMIT $2
+        ))
+        RETURNING *
+    ), archived AS (
+        INSERT INTO newsfeed_archive SELECT * FROM moved RETURNING type
+    ), counted AS (
+        INSERT INTO newsfeed_archive_counts (type, total)
+        SELECT type, count(*) FROM archived GROUP BY type
+        ON CONFLICT (type) DO UPDATE SET total = newsfeed_archive_counts.total + EXCLUDED.total
+    )
+    SELECT count(*) FROM archived
+"""
+
+
+def default_dsn() -> str:
+    """Build the DSN from the same environment variables as the app."""
+    return (
+        f"postgresql://{os.getenv('PSQL_USER')}:{os.getenv('PSQL_PASS')}"
+        f"@{os.getenv('PSQL_HOST')}:{os.getenv('PSQL_PORT')}/{os.getenv('PSQL_DB')}"
+    )
+
+
+async def compact(dsn: str, horizon_days: int, batch_size: int) -> int:
+    """Move every entry older than the horizon and return how many were moved."""
+    cutoff = datetime.datetime.now(datetime.UTC) - datetime.timedelta(days=horizon_days)
+    conn = await asyncpg.connect(dsn)
+    moved = 0
+    try:
+        while True:
+            async with conn.transaction():
+                count = await conn.fetchval(MOVE_QUERY, cutoff, batch_size)
+            moved += count
+            if count < batch_size:
+                break
+    finally:
+        await conn.close()
+    print(f"Moved {moved} entries older than {cutoff:%Y-%m-%d %H:%M} UTC to newsfeed_archive.")
+    return moved
+
+
+def main() -> None:
+    """Run the compaction."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=None, help="Postgres DSN, defaults to the PSQL_* environment variables.")
+    parser.add_argument(
+        "--horizon-days",
+        type=int,
+        default=int(os.getenv("NEWSFEED_HOT_DAYS", "90")),
+        help="Keep entries newer than this many days in the hot table.",
+    )
+    parser.add_argument("--batch-size", type=int, default=5000, help="Entries to move per transaction.")
+    args = parser.parse_args()
+    asyncio.run(compact(args.dsn or default_dsn(), args.horizon_days, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Remove duplicate newsfeed entries and enforce uniqueness.
+
+Run once after migrations/005_newsfeed_content_hash.sql. It backfills content_hash in batches, deletes every
+duplicate except the first copy and builds the unique index on content_hash concurrently. Safe to run again: an
+index left invalid by a failed build is dropped and rebuilt.
+
+Usage:
+    python scripts/dedupe_newsfeed.py [--dsn postgresql://...] [--batch-size 5000] [--dry-run]
+"""
+
+import argparse
+import asyncio
+import os
+
+import asyncpg
+
+BACKFILL_QUERY = """
+    WITH batch AS (
+        SELECT ctid FROM newsfeed WHERE content_hash IS NULL LIMIT $1
+    )
+    UPDATE newsfeed n
+    SET content_hash = newsfeed_content_hash(n.type, n.timestamp, n.data::jsonb)
+    FROM batch
+    WHERE n.ctid = batch.ctid
+"""
+
+DUPLICATES_QUERY = """
+    SELECT count(*) - count(DISTINCT content_hash) FROM newsfeed
+"""
+
+DELETE_QUERY = """
+    DELETE FROM newsfeed n
+    USING (
+        SELECT ctid, row_number() OVER (PARTITION BY content_hash ORDER BY ctid) AS copy
+        FROM newsfeed
+    ) d
+    WHERE n.ctid = d.ctid AND d.copy > 1
+"""
+
+UNIQUE_INDEX_QUERY = """
+    CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS newsfeed_content_hash_key ON newsfeed (content_hash)
+"""
+
+# NULL when the index does not exist, false when a failed concurrent build left it invalid.
+UNIQUE_INDEX_VALID_QUERY = """
+    SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass('newsfeed_content_hash_key')
+"""
+
+
+def default_dsn() -> str:
+    """Build the DSN from the same environment variables as the app."""
+    return (
+        f"postgresql://{os.getenv('PSQL_USER')}:{os.getenv('PSQL_PASS')}"
+        f"@{os.getenv('PSQL_HOST')}:{os.getenv('PSQL_PORT')}/{os.getenv('PSQL_DB')}"
+    )
+
+
+async def dedupe(dsn: str, batch_size: int, dry_run: bool) -> None:
+    """Backfill hashes, delete duplicates and add the unique index."""
+    conn = await asyncpg.connect(dsn)
+    try:
+        backfilled = 0
+        while True:
+            status = await conn.execute(BACKFILL_QUERY, batch_size)
+            updated = int(status.split()[-1])
+            backfilled += updated
+            if updated < batch_size:
+                break
+        print(f"Backfilled content_hash for {backfilled} entries.")
+
+        duplicates = await conn.fetchval(DUPLICATES_QUERY)
+        print(f"Found {duplicates} duplicate entries.")
+        if dry_run:
+            return
+        if duplicates:
+            async with conn.transaction():
+                # Hold off inserts while the duplicates are deleted. The lock is released on commit, before the index
+                # build, so a duplicate written in between by anything bypassing the insert trigger fails the build.
+                await conn.execute("LOCK TABLE newsfeed IN SHARE ROW EXCLUSIVE MODE")
+                status = await conn.execute(DELETE_QUERY)
+            print(f"Deleted {status.split()[-1]} duplicate entries.")
+
+        if await conn.fetchval(UNIQUE_INDEX_VALID_QUERY) is False:
+            await conn.execute("DROP INDEX CONCURRENTLY newsfeed_content_hash_key")
+            print("Dropped invalid index newsfeed_content_hash_key from a failed build.")
+
+        # Concurrent index builds cannot run inside a transaction block.
+        await conn.execute(UNIQUE_INDEX_QUERY)
+        print("Unique index newsfeed_content_hash_key is in place.")
+        # The unique index now backs the insert trigger's duplicate check.
+        await conn.execute("DROP INDEX CONCURRENTLY IF EXISTS newsfeed_content_hash_idx")
+    finally:
+        await conn.close()
+
+
+def main() -> None:
+    """Run the cleanup."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=None, help="Postgres DSN, defaults to the PSQL_* environment variables.")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Rows to backfill per statement.")
+    parser.add_argument("--dry-run", action="store_true", help="Backfill hashes and count duplicates only.")
+    args = parser.parse_args()
+    asyncio.run(dedupe(args.dsn or default_dsn(), args.batch_size, args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
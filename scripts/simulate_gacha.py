@@ -0,0 +1,183 @@
+"""Simulate lootbox drop rates for a weights table and benchmark pull throughput.
+
+Draws one reward per box for many simulated players, converting duplicates to coins the same way opening a box does,
+and reports per-rarity rates, coin inflation and how many boxes it takes to complete the collection.
+The catalog shape (rewards per rarity) is read from lootbox_reward_types when --dsn is given.
+
+Requires numpy, which is not an app dependency: pip install numpy
+
+Usage:
+    python scripts/simulate_gacha.py --players 10000 --boxes 500
+    python scripts/simulate_gacha.py --weights Legendary=2,Epic=6,Rare=22,Common=70 \
+        --dsn postgresql://... --key-type Classic
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import asyncpg
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+try:
+    import numpy as np
+except ImportError:
+    sys.exit("simulate_gacha.py requires numpy: pip install numpy")
+
+from utils.pull import COIN_CONVERT, WEIGHTS, gacha
+
+# Used when no database is given, roughly the size of a single key type's catalog.
+DEFAULT_SHAPE = {"Common": 60, "Rare": 30, "Epic": 15, "Legendary": 8}
+
+CHECKPOINTS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+def parse_weights(value: str | None) -> dict[str, float]:
+    """Parse Rarity=weight pairs, defaulting to the production WEIGHTS."""
+    if not value:
+        return {rarity: data["weight"] for rarity, data in WEIGHTS.items()}
+    weights = {}
+    for pair in value.split(","):
+        rarity, _, weight = pair.partition("=")
+        weights[rarity.strip().capitalize()] = float(weight)
+    return weights
+
+
+async def fetch_catalog_shape(dsn: str, key_type: str) -> dict[str, int]:
+    """Count rewards per rarity for a key type."""
+    conn = await asyncpg.connect(dsn)
+    try:
+        query = "SELECT rarity, count(*) AS amount FROM lootbox_reward_types WHERE key_type = $1 GROUP BY rarity"
+        rows = await conn.fetch(query, key_type)
+    finally:
+        await conn.close()
+    return {row["rarity"].capitalize(): row["amount"] for row in rows}
+
+
+def simulate(
+    weights: dict[str, float], shape: dict[str, int], players: int, boxes: int, rng: np.random.Generator
+) -> dict:
+    """Open boxes for every player and return per-box rarities, duplicate flags and coins."""
+    rarities = [rarity for rarity in weights if shape.get(rarity)]
+    probabilities = np.array([weights[rarity] for rarity in rarities], dtype=np.float64)
+    probabilities /= probabilities.sum()
+    counts = np.array([shape[rarity] for rarity in rarities])
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    coin_values = np.array([COIN_CONVERT.get(rarity.lower(), 0) for rarity in rarities])
+    total_items = int(counts.sum())
+
+    rarity_idx = rng.choice(len(rarities), size=(players, boxes), p=probabilities)
+    items = offsets[rarity_idx] + (rng.random((players, boxes)) * counts[rarity_idx]).astype(np.int64)
+
+    # Keys are ordered by player then box, so the first index of each key is when that player first pulled the item.
+    keys = (np.arange(players, dtype=np.int64)[:, None] * total_items + items).ravel()
+    _, first = np.unique(keys, return_index=True)
+    duplicate = np.ones(players * boxes, dtype=bool)
+    duplicate[first] = False
+    duplicate = duplicate.reshape(players, boxes)
+    coins = np.where(duplicate, coin_values[rarity_idx], 0)
+
+    first_player, first_box = np.divmod(first, boxes)
+    owned = np.bincount(first_player, minlength=players)
+    completed_at = np.zeros(players, dtype=np.int64)
+    np.maximum.at(completed_at, first_player, first_box + 1)
+    completed_at[owned < total_items] = -1
+
+    return {
+        "rarities": rarities,
+        "probabilities": probabilities,
+        "rarity_idx": rarity_idx,
+        "duplicate": duplicate,
+        "coins": coins,
+        "completed_at": completed_at,
+        "total_items": total_items,
+    }
+
+
+def report(result: dict, players: int, boxes: int) -> None:
+    """Print per-rarity rates, coin inflation and collection completion."""
+    rarity_idx, duplicate, coins = result["rarity_idx"], result["duplicate"], result["coins"]
+    pulls = players * boxes
+    print(f"{'rarity':<12}{'expected':>10}{'observed':>10}{'dup rate':>10}{'coins/box':>11}")
+    for idx, rarity in enumerate(result["rarities"]):
+        mask = rarity_idx == idx
+        hits = int(mask.sum())
+        dup_rate = duplicate[mask].mean() if hits else 0.0
+        print(
+            f"{rarity:<12}{result['probabilities'][idx]:>10.4f}{hits / pulls:>10.4f}"
+            f"{dup_rate:>10.4f}{coins[mask].sum() / pulls:>11.2f}"
+        )
+
+    print(f"\n{'boxes opened':<14}{'coins/player':>14}{'coins/box':>11}{'dup rate':>10}")
+    cumulative = coins.cumsum(axis=1)
+    for checkpoint in (c for c in CHECKPOINTS if c <= boxes):
+        window = slice(max(0, checkpoint - 1), checkpoint)
+        print(
+            f"{checkpoint:<14}{cumulative[:, checkpoint - 1].mean():>14.1f}"
+            f"{coins[:, window].mean():>11.2f}{duplicate[:, window].mean():>10.4f}"
+        )
+
+    completed_at = result["completed_at"]
+    done = completed_at[completed_at > 0]
+    print(f"\ncollection of {result['total_items']} rewards completed by {len(done) / players:.2%} of players")
+    if len(done):
+        p50, p90, p99 = np.percentile(done, [50, 90, 99])
+        print(
+            f"boxes to complete for those players: mean {done.mean():.0f}, "
+            f"p50 {p50:.0f}, p90 {p90:.0f}, p99 {p99:.0f}"
+        )
+
+
+def gacha_batch(weights: dict[str, float], opens: int, amount: int, rng: np.random.Generator) -> np.ndarray:
+    """Roll rarities for many multi-box opens at once."""
+    rarities = np.array(list(weights))
+    probabilities = np.array(list(weights.values()), dtype=np.float64)
+    return rarities[rng.choice(len(rarities), size=(opens, amount), p=probabilities / probabilities.sum())]
+
+
+def benchmark(weights: dict[str, float], opens: int, amount: int, rng: np.random.Generator) -> None:
+    """Compare pull throughput of utils.pull.gacha with the vectorized batch variant."""
+    print(f"\nthroughput for {opens} opens of {amount} boxes")
+    start = time.perf_counter()
+    for _ in range(opens):
+        gacha(amount)
+    elapsed = time.perf_counter() - start
+    print(f"{'gacha':<16}{opens * amount / elapsed:>14,.0f} pulls/s")
+
+    start = time.perf_counter()
+    gacha_batch(weights, opens, amount, rng)
+    elapsed = time.perf_counter() - start
+    print(f"{'gacha_batch':<16}{opens * amount / elapsed:>14,.0f} pulls/s")
+
+
+def main() -> None:
+    """Run the simulation and benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=10_000, help="Simulated players.")
+    parser.add_argument("--boxes", type=int, default=500, help="Boxes opened by each player.")
+    parser.add_argument("--weights", default=None, help="Proposed weights, e.g. Legendary=3,Epic=5,Rare=25,Common=65.")
+    parser.add_argument("--dsn", default=None, help="Postgres DSN to read the real catalog shape from.")
+    parser.add_argument("--key-type", default="Classic", help="Key type whose catalog is simulated with --dsn.")
+    parser.add_argument("--open-size", type=int, default=10, help="Boxes per open in the throughput benchmark.")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible runs.")
+    args = parser.parse_args()
+
+    weights = parse_weights(args.weights)
+    shape = asyncio.run(fetch_catalog_shape(args.dsn, args.key_type)) if args.dsn else DEFAULT_SHAPE
+    if not any(shape.get(rarity) for rarity in weights):
+        sys.exit(f"No rewards found for rarities {', '.join(weights)}.")
+    rng = np.random.default_rng(args.seed)
+
+    print(f"weights: {weights}\ncatalog: {shape}\n{args.players} players x {args.boxes} boxes\n")
+    start = time.perf_counter()
+    result = simulate(weights, shape, args.players, args.boxes, rng)
+    print(f"simulated {args.players * args.boxes:,} pulls in {time.perf_counter() - start:.2f}s\n")
+    report(result, args.players, args.boxes)
+    benchmark(weights, max(1, 1_000_000 // args.open_size), args.open_size, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Verify lootbox key balances against the lootbox_user_keys ledger.
+
+Prints every (user_id, key_type) whose balance differs from its ledger row count and exits with status 1 if any do.
+With --fix, balances are reset to the ledger counts, which also backfills missing balances.
+
+Usage:
+    python scripts/verify_key_balances.py [--dsn postgresql://...] [--fix]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+import asyncpg
+
+MISMATCH_QUERY = """
+    WITH ledger AS (
+        SELECT user_id, key_type, count(*) AS amount
+        FROM lootbox_user_keys
+        GROUP BY user_id, key_type
+    )
+    SELECT
+        coalesce(l.user_id, b.user_id) AS user_id,
+        coalesce(l.key_type, b.key_type) AS key_type,
+        coalesce(l.amount, 0) AS ledger,
+        coalesce(b.balance, 0) AS balance
+    FROM ledger l
+    FULL OUTER JOIN lootbox_user_key_balances b ON l.user_id = b.user_id AND l.key_type = b.key_type
+    WHERE coalesce(l.amount, 0) != coalesce(b.balance, 0)
+    ORDER BY 1, 2
+"""
+
+FIX_QUERY = """
+    INSERT INTO lootbox_user_key_balances (user_id, key_type, balance)
+    SELECT u.user_id, u.key_type, u.ledger
+    FROM unnest($1::bigint[], $2::text[], $3::int[]) AS u(user_id, key_type, ledger)
+    ON CONFLICT (user_id, key_type) DO UPDATE SET balance = EXCLUDED.balance
+"""
+
+
+def default_dsn() -> str:
+    """Build the DSN from the same environment variables as the app."""
+    return (
+        f"postgresql://{os.getenv('PSQL_USER')}:{os.getenv('PSQL_PASS')}"
+        f"@{os.getenv('PSQL_HOST')}:{os.getenv('PSQL_PORT')}/{os.getenv('PSQL_DB')}"
+    )
+
+
+async def verify(dsn: str, fix: bool) -> int:
+    """Report mismatched balances, fixing them when asked, and return how many were found."""
+    conn = await asyncpg.connect(dsn)
+    try:
+        async with conn.transaction():
+            # Block key grants and spends so the comparison and fix see one consistent state.
+            await conn.execute("LOCK TABLE lootbox_user_keys, lootbox_user_key_balances IN SHARE ROW EXCLUSIVE MODE")
+            rows = await conn.fetch(MISMATCH_QUERY)
+            for row in rows:
+                print(f"{row['user_id']}\t{row['key_type']}\tledger={row['ledger']}\tbalance={row['balance']}")
+            if fix and rows:
+                await conn.execute(
+                    FIX_QUERY,
+                    [row["user_id"] for row in rows],
+                    [row["key_type"] for row in rows],
+                    [row["ledger"] for row in rows],
+                )
+    finally:
+        await conn.close()
+    return len(rows)
+
+
+def main() -> None:
+    """Run the verification."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=None, help="Postgres DSN, defaults to the PSQL_* environment variables.")
+    parser.add_argument("--fix", action="store_true", help="Reset mismatched balances to the ledger counts.")
+    args = parser.parse_args()
+
+    mismatches = asyncio.run(verify(args.dsn or default_dsn(), args.fix))
+    if not mismatches:
+        print("All key balances match the ledger.")
+    elif args.fix:
+        print(f"Fixed {mismatches} key balances.")
+    else:
+        print(f"{mismatches} key balances do not match the ledger, rerun with --fix to repair them.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import pytest
+
+from controllers.rank_card.utils import SUPPORTED_CARD_FORMATS, card_media_type, negotiate_card_format
+
+
+def test_explicit_format_wins_over_accept() -> None:
+    assert negotiate_card_format("image/webp", "png") == "png"
+
+
+def test_no_accept_header_falls_back_to_png() -> None:
+    assert negotiate_card_format(None) == "png"
+    assert negotiate_card_format("") == "png"
+
+
+def test_unsupported_explicit_format_is_negotiated() -> None:
+    assert negotiate_card_format("image/webp", "gif") == "webp"
+
+
+def test_highest_quality_supported_type_is_picked() -> None:
+    assert negotiate_card_format("image/png;q=0.5, image/webp;q=0.9") == "webp"
+    assert negotiate_card_format("image/webp;q=0.5, image/png") == "png"
+
+
+def test_equal_quality_keeps_header_order() -> None:
+    assert negotiate_card_format("image/webp, image/png") == "webp"
+    assert negotiate_card_format("image/png, image/webp") == "png"
+
+
+def test_zero_quality_is_not_acceptable() -> None:
+    assert negotiate_card_format("image/webp;q=0") == "png"
+
+
+def test_bad_quality_and_unknown_types_fall_back_to_png() -> None:
+    assert negotiate_card_format("image/webp;q=high") == "png"
+    assert negotiate_card_format("text/html, */*;q=0.8") == "png"
+
+
+def test_media_type_is_case_insensitive() -> None:
+    assert negotiate_card_format("Image/WebP") == "webp"
+
+
+@pytest.mark.skipif("avif" in SUPPORTED_CARD_FORMATS, reason="Pillow can encode AVIF here")
+def test_unencodable_format_is_skipped() -> None:
+    assert negotiate_card_format("image/avif, image/webp;q=0.9") == "webp"
+
+
+@pytest.mark.parametrize("card_format", SUPPORTED_CARD_FORMATS)
+def test_media_type_negotiates_back_to_its_format(card_format: str) -> None:
+    assert negotiate_card_format(card_media_type(card_format)) == card_format
@@ -0,0 +1,34 @@
+import pytest
+from PIL import Image, ImageChops, ImageDraw
+
+from controllers.rank_card.utils import _LARGE_ATLAS, _SMALL_ATLAS, GlyphAtlas
+
+FILL = (255, 255, 255, 255)
+
+
+def _draw_pair(atlas: GlyphAtlas, text: str) -> tuple[Image.Image, Image.Image]:
+    blitted = Image.new("RGBA", (400, 100))
+    drawn = blitted.copy()
+    atlas.draw(blitted, (12, 7), text, FILL)
+    ImageDraw.Draw(drawn).text((12, 7), text, font=atlas.font, fill=FILL)
+    return blitted, drawn
+
+
+@pytest.mark.parametrize("atlas", [_SMALL_ATLAS, _LARGE_ATLAS], ids=["small", "large"])
+@pytest.mark.parametrize("text", ["0", "7", "48", "1111", "9/10", "120/350", "0123456789/"])
+def test_blitted_text_matches_image_draw(atlas: GlyphAtlas, text: str) -> None:
+    blitted, drawn = _draw_pair(atlas, text)
+    assert ImageChops.difference(blitted, drawn).getbbox() is None
+
+
+@pytest.mark.parametrize("atlas", [_SMALL_ATLAS, _LARGE_ATLAS], ids=["small", "large"])
+def test_text_length_matches_font(atlas: GlyphAtlas) -> None:
+    draw = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+    for text in ("5", "10/10", "2024"):
+        assert atlas.text_length(text) == draw.textlength(text, atlas.font)
+
+
+def test_supports_only_atlas_characters() -> None:
+    assert _SMALL_ATLAS.supports("12/34")
+    assert not _SMALL_ATLAS.supports("12 / 34")
+    assert not _SMALL_ATLAS.supports("nebula")
@@ -0,0 +1,48 @@
+import random
+from collections import Counter
+
+from controllers.lootbox.catalog import pick_rewards
+from controllers.lootbox.models import RewardTypeResponse
+from utils.pull import WEIGHTS, gacha
+
+
+def _reward(name: str, rarity: str) -> RewardTypeResponse:
+    return RewardTypeResponse(name=name, key_type="Classic", rarity=rarity, type="spray")
+
+
+POOLS = {
+    "common": [_reward("c1", "common"), _reward("c2", "common")],
+    "rare": [_reward("r1", "rare")],
+    "epic": [],
+}
+
+
+def test_gacha_returns_one_known_rarity_per_pull() -> None:
+    pulls = gacha(50)
+    assert len(pulls) == 50
+    assert set(pulls) <= set(WEIGHTS)
+
+
+def test_gacha_follows_weights() -> None:
+    random.seed(0)
+    counts = Counter(gacha(20_000))
+    total = sum(data["weight"] for data in WEIGHTS.values())
+    for rarity, data in WEIGHTS.items():
+        assert abs(counts[rarity] / 20_000 - data["weight"] / total) < 0.02
+
+
+def test_pick_rewards_picks_from_the_rolled_rarity() -> None:
+    rewards = pick_rewards(POOLS, ["Common", "Rare", "Common"])
+    assert [reward.rarity for reward in rewards] == ["common", "rare", "common"]
+    assert rewards[1].name == "r1"
+    assert {rewards[0].name, rewards[2].name} <= {"c1", "c2"}
+
+
+def test_pick_rewards_skips_empty_and_missing_rarities() -> None:
+    rewards = pick_rewards(POOLS, ["Epic", "Legendary", "Rare"])
+    assert [reward.name for reward in rewards] == ["r1"]
+
+
+def test_pick_rewards_can_repeat_a_reward() -> None:
+    rewards = pick_rewards(POOLS, ["Rare"] * 3)
+    assert [reward.name for reward in rewards] == ["r1", "r1", "r1"]
@@ -0,0 +1,38 @@
+import pytest
+
+from controllers.rank_card.models import MapMasteryData, build_map_mastery
+
+
+@pytest.mark.parametrize(
+    ("amount", "level"),
+    [
+        (0, "Placeholder"),
+        (4, "Placeholder"),
+        (5, "Rookie"),
+        (9, "Rookie"),
+        (10, "Explorer"),
+        (15, "Trailblazer"),
+        (20, "Pathfinder"),
+        (25, "Specialist"),
+        (30, "Prodigy"),
+        (500, "Prodigy"),
+    ],
+)
+def test_level_thresholds(amount: int, level: str) -> None:
+    (mastery,) = build_map_mastery([("Paris", amount)])
+    assert mastery.level == level
+
+
+def test_icon_url_uses_sanitized_name_and_level() -> None:
+    (mastery,) = build_map_mastery([("King's Row", 12)])
+    assert mastery.icon_url == "assets/mastery/kings_row_explorer.webp"
+
+
+def test_rows_keep_their_order() -> None:
+    result = build_map_mastery([("Paris", 3), ("Hanamura", 21)])
+    assert [(m.map_name, m.amount) for m in result] == [("Paris", 3), ("Hanamura", 21)]
+
+
+def test_matches_struct_defaults() -> None:
+    rows = [("Paris", 0), ("Hanamura", 17), ("King's Row", 31)]
+    assert build_map_mastery(rows) == [MapMasteryData(map_name, amount) for map_name, amount in rows]
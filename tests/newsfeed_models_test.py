@@ -0,0 +1,41 @@
+import msgspec
+import pytest
+
+from controllers.newsfeed.models import NewsfeedMapResponse, NewsfeedResponse
+from utils.utilities import convert_num_to_difficulty
+
+decode_page = msgspec.json.Decoder(list[NewsfeedResponse], strict=False).decode
+
+
+def _page(difficulty: object) -> bytes:
+    entry = {
+        "type": "new_map",
+        "timestamp": "2026-03-01T12:30:05+00:00",
+        "data": {"map": {"map_code": "ABCDE", "difficulty": difficulty}},
+        "total_results": 1,
+    }
+    return msgspec.json.encode([entry])
+
+
+@pytest.mark.parametrize(
+    ("difficulty", "name"),
+    [(0.3, "Beginner"), (2.5, "Medium -"), (5.0, "Hard"), (5, "Hard"), (9.9, "Hell")],
+)
+def test_numerical_difficulty_decodes_to_its_name(difficulty: float, name: str) -> None:
+    (entry,) = decode_page(_page(difficulty))
+    assert entry.data.map.difficulty == name
+
+
+def test_named_difficulty_is_kept() -> None:
+    (entry,) = decode_page(_page("Very Hard"))
+    assert entry.data.map.difficulty == "Very Hard"
+
+
+def test_missing_difficulty_stays_omitted() -> None:
+    (entry,) = decode_page(_page(None))
+    assert entry.data.map.difficulty is None
+    assert b"difficulty" not in msgspec.json.encode(entry)
+
+
+def test_constructed_struct_is_converted() -> None:
+    assert NewsfeedMapResponse(difficulty=7.8).difficulty == convert_num_to_difficulty(7.8)
@@ -0,0 +1,41 @@
+import datetime
+
+import pytest
+
+from controllers.newsfeed.models import NewsfeedDataResponse, NewsfeedStreamEvent
+from controllers.newsfeed.stream import MAX_CONTENT_HASH, parse_event_id
+
+CONTENT_HASH = "0b4c3a1e-6f0d-4d6e-9a57-3f3f0c2b9d11"
+
+
+def test_event_id_round_trips() -> None:
+    timestamp = datetime.datetime(2026, 3, 1, 12, 30, 5, 123456, tzinfo=datetime.UTC)
+    event = NewsfeedStreamEvent("record", timestamp, NewsfeedDataResponse(), CONTENT_HASH)
+    assert parse_event_id(event.event_id) == (timestamp, CONTENT_HASH)
+
+
+def test_bare_timestamp_resumes_after_every_entry_at_it() -> None:
+    timestamp, content_hash = parse_event_id("2026-03-01T12:30:05+00:00")
+    assert timestamp == datetime.datetime(2026, 3, 1, 12, 30, 5, tzinfo=datetime.UTC)
+    assert content_hash == MAX_CONTENT_HASH
+    assert (timestamp, CONTENT_HASH) < (timestamp, content_hash)
+
+
+def test_naive_timestamp_is_utc() -> None:
+    timestamp, _ = parse_event_id(f"2026-03-01T12:30:05/{CONTENT_HASH}")
+    assert timestamp.tzinfo is not None
+    assert timestamp == datetime.datetime(2026, 3, 1, 12, 30, 5, tzinfo=datetime.UTC)
+
+
+def test_content_hash_is_normalized() -> None:
+    _, content_hash = parse_event_id(f"2026-03-01T12:30:05+00:00/{CONTENT_HASH.upper().replace('-', '')}")
+    assert content_hash == CONTENT_HASH
+
+
+@pytest.mark.parametrize(
+    "event_id",
+    ["", "yesterday", f"yesterday/{CONTENT_HASH}", "2026-03-01T12:30:05+00:00/not-a-uuid"],
+)
+def test_bad_event_id_raises_value_error(event_id: str) -> None:
+    with pytest.raises(ValueError):
+        parse_event_id(event_id)
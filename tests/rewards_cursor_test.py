@@ -0,0 +1,39 @@
+import base64
+
+import pytest
+from litestar.exceptions import HTTPException
+
+from controllers.lootbox.lootbox import _decode_cursor, _encode_cursor
+
+
+@pytest.mark.parametrize(
+    "position",
+    [
+        ("spray", "Genji", "Classic"),
+        ("", "", ""),
+        ("voice line", "名前 🥷", "Winter/2024"),
+    ],
+)
+def test_cursor_round_trips(position: tuple[str, str, str]) -> None:
+    assert _decode_cursor(_encode_cursor(*position)) == position
+
+
+def test_cursor_is_url_safe() -> None:
+    cursor = _encode_cursor("spray", "???>>>", "Classic")
+    assert set(cursor) <= set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_=")
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not base64!",
+        "abc",
+        base64.urlsafe_b64encode(b"not json").decode(),
+        base64.urlsafe_b64encode(b'["spray", "Genji"]').decode(),
+        base64.urlsafe_b64encode(b'["spray", "Genji", 3]').decode(),
+    ],
+)
+def test_bad_cursor_is_rejected(cursor: str) -> None:
+    with pytest.raises(HTTPException) as error:
+        _decode_cursor(cursor)
+    assert error.value.status_code == 400
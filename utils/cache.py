@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class LRUCache(Generic[K, V]):
+    """In-process LRU cache with an optional time-to-live.
+
+    Entries are evicted least recently used first once ``maxsize`` is reached.
+    When ``ttl`` is set, entries older than ``ttl`` seconds are treated as missing.
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: float | None = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Count the stored entries, including expired ones not yet evicted."""
+        return len(self._data)
+
+    def __contains__(self, key: K) -> bool:
+        """Check whether a key is present and not expired."""
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        """Get a value if it is present and not expired."""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        stored_at, value = entry
+        if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: K, value: V) -> None:
+        """Store a value, evicting the least recently used entry if full."""
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K, default: V | None = None) -> V | None:
+        """Remove a value and return it."""
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return default
+        return entry[1]
+
+    def clear(self) -> None:
+        """Remove all values."""
+        self._data.clear()
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import TYPE_CHECKING
+
+from utils.cache import LRUCache
+
+if TYPE_CHECKING:
+    import asyncpg
+
+# Totals are the same for every user, so they are shared process wide and keyed only by include_beginner.
+# Handlers that change maps call invalidate_map_totals, and readers that know the rank card global version pass it
+# so rating changes made outside the API are picked up. The TTL covers everything else.
+_map_totals: LRUCache[bool, tuple[int | None, dict[str, int]]] = LRUCache(
+    maxsize=2, ttl=float(os.getenv("MAP_TOTALS_CACHE_TTL", "600"))
+)
+_refresh_lock = asyncio.Lock()
+
+
+async def _fetch_map_totals(conn: asyncpg.Connection) -> dict[str, int]:
+    query = """
+        WITH ranges ("range", "name") AS (
+             VALUES  ('[0,0.59)'::numrange, 'Beginner'),
+                     ('[0.59,2.35)'::numrange, 'Easy'),
+                     ('[2.35,4.12)'::numrange, 'Medium'),
+                     ('[4.12,5.88)'::numrange, 'Hard'),
+                     ('[5.88,7.65)'::numrange, 'Very Hard'),
+                     ('[7.65,9.41)'::numrange, 'Extreme'),
+                     ('[9.41,10.0]'::numrange, 'Hell')
+        ), map_data AS
+        (SELECT avg(difficulty) as difficulty FROM maps m
+        LEFT JOIN map_ratings mr ON m.map_code = mr.map_code WHERE m.official = TRUE
+                AND m.archived = FALSE GROUP BY m.map_code)
+        SELECT name, count(name) as total FROM map_data md
+        INNER JOIN ranges r ON r.range @> md.difficulty
+        GROUP BY name
+    """
+    return {row["name"]: row["total"] for row in await conn.fetch(query)}
+
+
+async def get_map_totals(
+    conn: asyncpg.Connection, include_beginner: bool, version: int | None = None
+) -> dict[str, int]:
+    """Get the number of official, unarchived maps per difficulty.
+
+    Without beginner, Beginner maps are counted as Easy. When version is given, totals cached under another
+    rank_card_global_version are reloaded.
+    """
+    entry = _map_totals.get(include_beginner)
+    if entry is not None and (version is None or entry[0] == version):
+        return entry[1]
+
+    async with _refresh_lock:
+        entry = _map_totals.get(include_beginner)
+        if entry is not None and (version is None or entry[0] == version):
+            return entry[1]
+
+        with_beginner = await _fetch_map_totals(conn)
+        without_beginner = dict(with_beginner)
+        if "Beginner" in without_beginner:
+            without_beginner["Easy"] = without_beginner.pop("Beginner") + without_beginner.get("Easy", 0)
+        _map_totals.set(True, (version, with_beginner))
+        _map_totals.set(False, (version, without_beginner))
+    return with_beginner if include_beginner else without_beginner
+
+
+def invalidate_map_totals() -> None:
+    """Drop cached totals so the next read reloads them."""
+    _map_totals.clear()
@@ -15,6 +15,14 @@ WEIGHTS = {
     },
 }
 
+# Coins given instead of a duplicate reward, by lowercase rarity.
+COIN_CONVERT = {
+    "common": 100,
+    "rare": 250,
+    "epic": 500,
+    "legendary": 1000,
+}
+
 
 def gacha(amount: int) -> list[str]:
     """Pull random rarities."""
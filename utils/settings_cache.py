@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import os
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, TypeVar
+
+from utils.cache import LRUCache
+
+if TYPE_CHECKING:
+    import asyncpg
+
+V = TypeVar("V")
+
+_MISSING = object()
+
+# Entries are keyed by (field, user_id) and dropped by the handlers that write the field.
+# A read that races a write can store the old value, so the TTL bounds how long that can last.
+_user_settings: LRUCache[tuple[str, int], Any] = LRUCache(
+    maxsize=int(os.getenv("USER_SETTINGS_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("USER_SETTINGS_CACHE_TTL", "300")),
+)
+
+PROFILE_FIELDS = ("notifications", "background", "skin", "pose")
+
+_PROFILE_QUERY = """
+    SELECT
+        (SELECT flags FROM user_notification_settings WHERE user_id = $1) AS notifications,
+        (SELECT name FROM rank_card_background WHERE user_id = $1) AS background,
+        a.skin,
+        a.pose
+    FROM (SELECT 1) AS one
+    LEFT JOIN rank_card_avatar a ON a.user_id = $1
+"""
+
+
+async def get_profile_setting(conn: asyncpg.Connection, user_id: int, field: str) -> Any:  # noqa: ANN401
+    """Get one of PROFILE_FIELDS for a user, filling every profile field from one query on a miss."""
+    value = _user_settings.get((field, user_id), _MISSING)
+    if value is _MISSING:
+        row = await conn.fetchrow(_PROFILE_QUERY, user_id)
+        for name in PROFILE_FIELDS:
+            _user_settings.set((name, user_id), row[name])
+        value = row[field]
+    return value
+
+
+async def get_user_setting(user_id: int, field: str, load: Callable[[], Awaitable[V]]) -> V:
+    """Get a cached setting for a user, calling load to fetch it on a miss."""
+    value = _user_settings.get((field, user_id), _MISSING)
+    if value is _MISSING:
+        value = await load()
+        _user_settings.set((field, user_id), value)
+    return value
+
+
+def invalidate_user_settings(user_id: int, *fields: str) -> None:
+    """Drop cached settings for a user after they change."""
+    for field in fields:
+        _user_settings.pop((field, user_id))
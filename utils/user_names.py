@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import os
+from typing import TYPE_CHECKING
+
+from utils.cache import LRUCache
+
+if TYPE_CHECKING:
+    import asyncpg
+
+# Global names keyed by user_id. "user_name_change" events drop entries, the TTL covers changes that are not announced.
+# Unknown users are not cached so they resolve as soon as they are created.
+_user_names: LRUCache[int, str | None] = LRUCache(
+    maxsize=int(os.getenv("USER_NAME_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("USER_NAME_CACHE_TTL", "600")),
+)
+
+_MISSING = object()
+
+
+async def get_global_names(conn: asyncpg.Connection, user_ids: list[int]) -> dict[int, str | None]:
+    """Get the global names of known users, fetching every cache miss in one query."""
+    names: dict[int, str | None] = {}
+    misses = []
+    for user_id in dict.fromkeys(user_ids):
+        name = _user_names.get(user_id, _MISSING)
+        if name is _MISSING:
+            misses.append(user_id)
+        else:
+            names[user_id] = name
+    if misses:
+        rows = await conn.fetch("SELECT user_id, global_name FROM users WHERE user_id = ANY($1::bigint[])", misses)
+        for row in rows:
+            _user_names.set(row["user_id"], row["global_name"])
+            names[row["user_id"]] = row["global_name"]
+    return names
+
+
+def invalidate_user_names(*user_ids: int) -> None:
+    """Drop cached names for users after they change."""
+    for user_id in user_ids:
+        _user_names.pop(user_id)